@@ -1,33 +1,45 @@
 import os
 import sys
 import json
-import redis
 from flask import Flask
 from flask_cors import CORS
-import hopsworks
 from bearing_condition_predictor.config import Config
-from bearing_condition_predictor.initialisation import FeatureGroupsLoader, ModelLoader
+from bearing_condition_predictor.initialisation import get_project, get_feature_groups_loader
+from bearing_condition_predictor.config_client import get_config_client
 
-app = Flask(__name__)
-CORS(app)
+# Nothing here talks to Redis, Hopsworks or loads models at import time: the app is
+# built by create_app, and the project, feature groups and models on first use
 
 # Function to load config.json onto Redis
 def load_config_to_redis(config_path, redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings'):
     with open(config_path, 'r') as file:
         config_data = json.load(file)
 
-    r = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
-    config_data_str = json.dumps(config_data)
-    r.set(redis_key, config_data_str)
+    # Published so running bridges and gateways pick it up
+    get_config_client(redis_host, redis_port, redis_db, redis_key).publish(config_data)
 
-# Load config.json onto Redis
-load_config_to_redis("config.json")
+def create_app(config_path="config.json"):
+    app = Flask(__name__)
+    CORS(app)
 
-project = hopsworks.login(api_key_value=Config.HOPSWORKS_API_KEY)
-feature_groups_loader = FeatureGroupsLoader(project)
-ModelLoader(project)
+    # Load config.json onto Redis
+    load_config_to_redis(config_path)
 
-from bearing_condition_predictor.endpoints import endpoints_bp
-app.register_blueprint(endpoints_bp)
+    from bearing_condition_predictor.endpoints import endpoints_bp
+    app.register_blueprint(endpoints_bp)
+    return app
 
-from bearing_condition_predictor.celery import celery
\ No newline at end of file
+_app = None
+
+def __getattr__(name):
+    # Module level app/project/feature_groups_loader, created when first imported
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    if name == "project":
+        return get_project()
+    if name == "feature_groups_loader":
+        return get_feature_groups_loader()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
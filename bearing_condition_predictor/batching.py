@@ -0,0 +1,171 @@
+import threading
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+from bearing_condition_predictor.config import Config
+
+class QueueClosed(Exception):
+    pass
+
+# Put on the queue by close(); the worker thread exits once it reaches it
+_CLOSE = object()
+
+class _PendingRequest:
+    def __init__(self, model, inputs):
+        self.model = model
+        self.inputs = inputs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+class BatchingQueue:
+    # Collects single-snapshot requests for one model version and runs them through
+    # one batched forward pass once max_batch_size is reached or the oldest request
+    # has waited max_latency seconds
+
+    METRICS_WINDOW = 1000
+
+    def __init__(self, max_batch_size, max_latency):
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batch_sizes = deque(maxlen=self.METRICS_WINDOW)
+        self.wait_times = deque(maxlen=self.METRICS_WINDOW)
+        self.total_batches = 0
+        self.total_requests = 0
+        self.closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, model, inputs):
+        # inputs is the list of model inputs for a batch of one; returns a Future
+        # resolving to that request's row of the model output. The model travels with
+        # the request so an idle queue holds no reference to an evicted version.
+        pending = _PendingRequest(model, inputs)
+        with self._lock:
+            if self.closed:
+                raise QueueClosed()
+            self._queue.put(pending)
+        return pending.future
+
+    def close(self):
+        # Requests already submitted are still run; then the worker thread exits and
+        # releases the last model it ran
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._queue.put(_CLOSE)
+
+    def _collect(self):
+        # The next batch, or None once the queue is closed and drained
+        first = self._queue.get()
+        if first is _CLOSE:
+            return None
+        batch = [first]
+        deadline = batch[0].enqueued_at + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if pending is _CLOSE:
+                # Seen again by the next _collect, after this batch has run
+                self._queue.put(_CLOSE)
+                break
+            batch.append(pending)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            dispatched_at = time.monotonic()
+            # Only requests with the same input shapes are stacked together, so a
+            # malformed one fails on its own instead of failing the whole batch
+            groups = {}
+            for pending in batch:
+                shapes = tuple(np.shape(part)[1:] for part in pending.inputs)
+                groups.setdefault(shapes, []).append(pending)
+            for group in groups.values():
+                self._predict(group)
+
+            with self._lock:
+                self.batch_sizes.append(len(batch))
+                self.wait_times.append(max(dispatched_at - pending.enqueued_at for pending in batch))
+                self.total_batches += 1
+                self.total_requests += len(batch)
+            # Release the batch, and with it the model, before blocking for the next one
+            batch = pending = groups = group = None
+
+    def _predict(self, group):
+        # Every request gets its result or the exception; the worker thread never dies
+        try:
+            inputs = [np.concatenate(parts) for parts in zip(*(pending.inputs for pending in group))]
+            # The newest request carries the most recently resolved model object
+            outputs = group[-1].model.predict(inputs, verbose=0)
+        except Exception as e:
+            for pending in group:
+                pending.future.set_exception(e)
+        else:
+            for i, pending in enumerate(group):
+                pending.future.set_result(outputs[i:i + 1])
+
+    def metrics(self):
+        with self._lock:
+            sizes = np.array(self.batch_sizes)
+            waits = np.array(self.wait_times) * 1000
+            return {
+                "total_batches": self.total_batches,
+                "total_requests": self.total_requests,
+                "queue_depth": self._queue.qsize(),
+                "batch_size_mean": float(sizes.mean()) if len(sizes) else None,
+                "batch_size_max": int(sizes.max()) if len(sizes) else None,
+                "wait_ms_mean": float(waits.mean()) if len(waits) else None,
+                "wait_ms_p95": float(np.percentile(waits, 95)) if len(waits) else None,
+                "wait_ms_max": float(waits.max()) if len(waits) else None,
+            }
+
+class InferenceBatcher:
+    # One BatchingQueue per (model, version), created on first use and removed when
+    # ModelLoader drops the version
+    _queues = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def predict(cls, model_name, version, model, inputs):
+        key = (model_name, int(version))
+        while True:
+            with cls._lock:
+                batching_queue = cls._queues.get(key)
+                if batching_queue is None:
+                    batching_queue = BatchingQueue(Config.BATCH_MAX_SIZE, Config.BATCH_MAX_LATENCY_MS / 1000)
+                    cls._queues[key] = batching_queue
+            try:
+                future = batching_queue.submit(model, inputs)
+            except QueueClosed:
+                # Removed since it was looked up; the next pass creates a new one
+                continue
+            return future.result()
+
+    @classmethod
+    def remove(cls, model_name, version):
+        # Closes the version's queue, so its worker thread and model reference go too
+        with cls._lock:
+            batching_queue = cls._queues.pop((model_name, int(version)), None)
+        if batching_queue is not None:
+            batching_queue.close()
+
+    @classmethod
+    def metrics(cls):
+        with cls._lock:
+            queues = dict(cls._queues)
+        return {f"{model_name}/{version}": batching_queue.metrics()
+                for (model_name, version), batching_queue in queues.items()}
@@ -8,9 +8,7 @@ import os
 # Add the parent directory to the system path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bearing_feat_eng_pipeline.feat_eng_pipe import FeatureEngineeringPipeline # Ensure the correct import
-from bearing_model_training_pipeline.training_pipe import ModelTrainer
-from bearing_condition_predictor import project
+from bearing_condition_predictor.initialisation import get_project
 
 # Initialize Celery
 redis_broker_url = os.getenv('BROKER_URL', 'redis://localhost:6379/0')
@@ -20,17 +18,27 @@ celery.control.purge()
 
 @celery.task(name='celery.run_feat_pipe', queue='feat_pipe_queue')
 def run_feat_pipe(batch_size=50):
+    # Pipelines are imported here so that importing the app does not pull in TensorFlow
+    from bearing_feat_eng_pipeline.feat_eng_pipe import FeatureEngineeringPipeline
     pipeline = FeatureEngineeringPipeline('bearing_predictions.csv', 'last_position.txt')
     pipeline.run()
     
 @celery.task(name='celery.run_training_pipe', queue='training_pipe_queue')
 def run_training_pipe():
+    from bearing_model_training_pipeline.training_pipe import ModelTrainer
     trainer = ModelTrainer(
-        project=project,
+        project=get_project(),
         test_size=0.1,
-        model_description="classifier"
+        model_description="classifier",
+        # Scored on the evaluation queue, so this worker is free for the next run
+        submit_evaluation=run_evaluation.delay
     )
     trainer.run()
+
+@celery.task(name='celery.run_evaluation', queue='evaluation_queue')
+def run_evaluation(candidate_dir):
+    from bearing_model_training_pipeline.training_pipe import ModelPromoter
+    ModelPromoter(project=get_project()).evaluate(candidate_dir)
     
 
 # Periodic tasks can be scheduled here
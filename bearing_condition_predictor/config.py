@@ -2,3 +2,88 @@ import os
 
 class Config:
     HOPSWORKS_API_KEY = os.environ.get('HOPSWORKS_API_KEY')
+    # Serve only from LOCAL_MODEL_BASE_DIR and never log in to Hopsworks
+    OFFLINE = os.environ.get('OFFLINE', 'false').lower() in ('1', 'true', 'yes')
+    # "exact" (scipy gaussian_kde) or "binned" for the KL features in the predict path
+    KL_ESTIMATOR = os.environ.get('KL_ESTIMATOR', 'exact')
+    # Micro-batching of concurrent predict requests for the same model version
+    BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 16))
+    BATCH_MAX_LATENCY_MS = float(os.environ.get('BATCH_MAX_LATENCY_MS', 20))
+    # "keras", "function" (tf.function with a fixed input signature), "tflite"
+    # or "numpy" (TensorFlow-free engine over exported .npz weights)
+    MODEL_SERVING = os.environ.get('MODEL_SERVING', 'keras')
+    # "binary" for the segmented float32 feature log in FEATURE_LOG_DIR, or "csv" for
+    # the JSON-in-CSV bearing_predictions.csv
+    FEATURE_LOG_FORMAT = os.environ.get('FEATURE_LOG_FORMAT', 'binary')
+    FEATURE_LOG_DIR = os.environ.get('FEATURE_LOG_DIR', 'feature_log')
+    # Concurrent feature group inserts in FeatureEngineeringPipeline.upload_features
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 5))
+    UPLOAD_RETRIES = int(os.environ.get('UPLOAD_RETRIES', 3))
+    UPLOAD_BACKOFF = float(os.environ.get('UPLOAD_BACKOFF', 2.0))
+    # "hopsworks", or "local" for the Parquet feature store and model registry in
+    # LOCAL_FEATURE_STORE_DIR
+    FEATURE_STORE = os.environ.get('FEATURE_STORE', 'hopsworks')
+    LOCAL_FEATURE_STORE_DIR = os.environ.get('LOCAL_FEATURE_STORE_DIR', 'local_feature_store')
+    # AutoEncoder labelling in the feature pipeline: warm start fine-tunes the weights
+    # persisted in AUTOENCODER_WEIGHTS for at most AUTOENCODER_FINE_TUNE_EPOCHS per chunk,
+    # stopping early after AUTOENCODER_PATIENCE epochs without a lower reconstruction loss
+    AUTOENCODER_WARM_START = os.environ.get('AUTOENCODER_WARM_START', 'true').lower() in ('1', 'true', 'yes')
+    AUTOENCODER_WEIGHTS = os.environ.get('AUTOENCODER_WEIGHTS', 'autoencoder_weights.npz')
+    AUTOENCODER_MAX_EPOCHS = int(os.environ.get('AUTOENCODER_MAX_EPOCHS', 100))
+    AUTOENCODER_FINE_TUNE_EPOCHS = int(os.environ.get('AUTOENCODER_FINE_TUNE_EPOCHS', 20))
+    AUTOENCODER_PATIENCE = int(os.environ.get('AUTOENCODER_PATIENCE', 5))
+    # "streaming" keeps stage clusters and anomaly score statistics across chunks in
+    # AUTOENCODER_CLUSTER_STATE, or "kmeans" to refit per chunk
+    AUTOENCODER_CLUSTERING = os.environ.get('AUTOENCODER_CLUSTERING', 'streaming')
+    AUTOENCODER_CLUSTER_STATE = os.environ.get('AUTOENCODER_CLUSTER_STATE', 'autoencoder_clusters.pkl')
+    # ModelTrainer keeps the feature view rows in TRAINING_CACHE_DIR and only fetches
+    # rows above the cached 'index' high-water mark on each retrain
+    TRAINING_CACHE = os.environ.get('TRAINING_CACHE', 'true').lower() in ('1', 'true', 'yes')
+    TRAINING_CACHE_DIR = os.environ.get('TRAINING_CACHE_DIR', 'training_cache')
+    # "memory" fits on in-memory arrays, or "stream" feeds the classifier from the
+    # training cache files through tf.data with TRAINING_SHUFFLE_BUFFER rows of shuffle
+    # buffer, reading TRAINING_BLOCK_ROWS rows at a time
+    TRAINING_INPUT = os.environ.get('TRAINING_INPUT', 'memory')
+    TRAINING_BATCH_SIZE = int(os.environ.get('TRAINING_BATCH_SIZE', 512))
+    TRAINING_SHUFFLE_BUFFER = int(os.environ.get('TRAINING_SHUFFLE_BUFFER', 4096))
+    TRAINING_BLOCK_ROWS = int(os.environ.get('TRAINING_BLOCK_ROWS', 256))
+    # "incremental" fine-tunes the served version on rows added since it was trained plus
+    # REPLAY_SAMPLE older rows, with a full retrain every FULL_RETRAIN_EVERY versions or
+    # when its accuracy on new test rows drops by more than DRIFT_ACCURACY_DROP; "full"
+    # always retrains from create_model(). A fine-tune needs at least
+    # FINE_TUNE_MIN_NEW_ROWS new training rows, otherwise no version is trained. The
+    # replay sample is drawn with REPLAY_SEED, by default the new version number
+    TRAINING_MODE = os.environ.get('TRAINING_MODE', 'incremental')
+    FULL_RETRAIN_EVERY = int(os.environ.get('FULL_RETRAIN_EVERY', 10))
+    REPLAY_SAMPLE = int(os.environ.get('REPLAY_SAMPLE', 4096))
+    REPLAY_SEED = int(os.environ['REPLAY_SEED']) if os.environ.get('REPLAY_SEED') else None
+    FINE_TUNE_MIN_NEW_ROWS = int(os.environ.get('FINE_TUNE_MIN_NEW_ROWS', 1))
+    FINE_TUNE_EPOCHS = int(os.environ.get('FINE_TUNE_EPOCHS', 15))
+    FINE_TUNE_PATIENCE = int(os.environ.get('FINE_TUNE_PATIENCE', 3))
+    FINE_TUNE_LEARNING_RATE = float(os.environ.get('FINE_TUNE_LEARNING_RATE', 1e-4))
+    DRIFT_ACCURACY_DROP = float(os.environ.get('DRIFT_ACCURACY_DROP', 0.1))
+    DRIFT_MIN_ROWS = int(os.environ.get('DRIFT_MIN_ROWS', 50))
+    # Promotion gate: a new version is published only if its held-out accuracy is at
+    # least PROMOTION_MIN_ACCURACY and no more than PROMOTION_MAX_ACCURACY_DROP below the
+    # served version, no class loses more than PROMOTION_MAX_CLASS_ACCURACY_DROP, and its
+    # single-row p50 latency is within PROMOTION_MAX_LATENCY_RATIO of the served version
+    EVALUATION_WORKERS = int(os.environ.get('EVALUATION_WORKERS', 2))
+    EVALUATION_LATENCY_ROWS = int(os.environ.get('EVALUATION_LATENCY_ROWS', 200))
+    PROMOTION_MIN_ACCURACY = float(os.environ.get('PROMOTION_MIN_ACCURACY', 0.0))
+    PROMOTION_MAX_ACCURACY_DROP = float(os.environ.get('PROMOTION_MAX_ACCURACY_DROP', 0.0))
+    PROMOTION_MAX_CLASS_ACCURACY_DROP = float(os.environ.get('PROMOTION_MAX_CLASS_ACCURACY_DROP', 0.1))
+    PROMOTION_MAX_LATENCY_RATIO = float(os.environ.get('PROMOTION_MAX_LATENCY_RATIO', 1.5))
+    # Byte budget of the gateway's loaded model versions; the newest
+    # MODEL_CACHE_PINNED_VERSIONS versions of each model are never evicted
+    MODEL_CACHE_MAX_BYTES = int(os.environ.get('MODEL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    MODEL_CACHE_PINNED_VERSIONS = int(os.environ.get('MODEL_CACHE_PINNED_VERSIONS', 2))
+    # Versions downloaded from the model registry and loaded at the same time
+    MODEL_LOAD_WORKERS = int(os.environ.get('MODEL_LOAD_WORKERS', 4))
+    # MQTT inference worker: broker, feature extraction processes and snapshots labelled
+    # at the same time
+    MQTT_BROKER = os.environ.get('MQTT_BROKER', 'localhost')
+    MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+    INFERENCE_FEATURE_WORKERS = int(os.environ.get('INFERENCE_FEATURE_WORKERS', os.cpu_count() or 1))
+    INFERENCE_MAX_IN_FLIGHT = int(os.environ.get('INFERENCE_MAX_IN_FLIGHT', 8))
+    # Oldest snapshots of a bearing are dropped beyond this many waiting to be labelled
+    INFERENCE_MAX_QUEUED_PER_BEARING = int(os.environ.get('INFERENCE_MAX_QUEUED_PER_BEARING', 100))
@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+import redis
+
+# In-memory copy of the model config kept in Redis under config:settings, shared by
+# the gateway, the MQTT bridge and the training pipeline. Redis is read again only
+# when an update is published on REDIS_UPDATES_CHANNEL, or the key changes with
+# keyspace notifications enabled (notify-keyspace-events K$), so serving a request
+# reads the parsed config and its routing target from memory.
+
+class ConfigClient:
+    REDIS_UPDATES_CHANNEL = 'config:updates'
+
+    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings'):
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.redis_db = redis_db
+        self.redis_key = redis_key
+        self.redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
+        # Held across the Redis read or write and the in-memory update, so a refresh
+        # cannot replace a newer config with the older value it read
+        self._lock = threading.Lock()
+        # Listeners are called one refresh at a time, with the config current by then
+        self._notify_lock = threading.Lock()
+        self._listeners = []
+        self._raw = None
+        self._config = None
+        self._latest_model = None
+        self.refresh()
+        threading.Thread(target=self._listen_for_updates, daemon=True).start()
+
+    def get(self):
+        # The parsed config, or None if there is none in Redis; shared, so callers that
+        # change it work on a copy
+        return self._config
+
+    def latest_model(self):
+        # (model_subdirectory, version) of the highest version listed, or None
+        return self._latest_model
+
+    def add_listener(self, callback):
+        # callback(config) runs on the listener thread after every refresh
+        with self._lock:
+            self._listeners.append(callback)
+
+    def refresh(self):
+        with self._lock:
+            raw = self.redis_client.get(self.redis_key)
+            if raw != self._raw:
+                self._set(raw, json.loads(raw) if raw is not None else None)
+        with self._notify_lock:
+            with self._lock:
+                config = self._config
+                listeners = list(self._listeners)
+            for callback in listeners:
+                try:
+                    callback(config)
+                except Exception as e:
+                    print(f"Config listener failed: {e}")
+        return config
+
+    def publish(self, config):
+        # Writes the config and notifies every client, this one included right away
+        raw = json.dumps(config).encode()
+        with self._lock:
+            self.redis_client.set(self.redis_key, raw)
+            self._set(raw, json.loads(raw))
+        self.redis_client.publish(self.REDIS_UPDATES_CHANNEL, self.redis_key)
+
+    def _set(self, raw, config):
+        self._raw = raw
+        self._config = config
+        self._latest_model = self._find_latest_model(config)
+
+    @staticmethod
+    def _find_latest_model(config):
+        latest = None
+        for model_entries in (config or {}).get('MODELS', {}).values():
+            for entry in model_entries:
+                version = entry.get('version', -1)
+                if latest is None or version > latest[1]:
+                    latest = (entry['model_subdirectory'], version)
+        return latest
+
+    def _listen_for_updates(self):
+        # Each (re)subscription starts with a refresh so updates published while
+        # disconnected are not missed
+        keyspace_channel = f"__keyspace@{self.redis_db}__:{self.redis_key}"
+        while True:
+            try:
+                pubsub = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self.REDIS_UPDATES_CHANNEL, keyspace_channel)
+                self.refresh()
+                for _ in pubsub.listen():
+                    self.refresh()
+            except Exception as e:
+                print(f"Config update subscription failed ({e}), resubscribing")
+                time.sleep(1)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_config_client(redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings'):
+    # One client, and one subscription, per process and config key
+    key = (redis_host, redis_port, redis_db, redis_key)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ConfigClient(*key)
+        return _clients[key]
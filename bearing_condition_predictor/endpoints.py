@@ -4,30 +4,32 @@ import sys
 from time import sleep
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-from tensorflow import keras
-import hopsworks
 import json
 
 #script_dir = os.path.dirname(os.path.abspath(__file__))
 #parent_dir = os.path.dirname(script_dir)
 #sys.path.append(parent_dir)
 
-from bearing_condition_predictor.initialisation import ModelLoader
-from bearing_condition_predictor.single_feat_eng import ToFrequency, ToTime
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.initialisation import ModelLoader, ModelNotFound, ModelUnavailable
+from bearing_condition_predictor.batching import InferenceBatcher
+from bearing_condition_predictor.feature_log import get_feature_log
+from bearing_condition_predictor.single_feat_eng import extract_features, FREQUENCY_COLUMNS, TIME_COLUMNS
+from snapshot_format import SNAPSHOT_CONTENT_TYPE, check_rows, decode_snapshot, snapshot_from_records
 #from bearing_condition_predictor.add_feat_pipe import feat_pipe
 
 endpoints_bp = Blueprint('endpoints', __name__)
 
-def feat_eng_single_row(df):
-    df_freq = ToFrequency(df)
-    df_time = ToTime(df)
-    return df_freq, df_time
+def feat_eng_single_row(hacc, vacc):
+    h_freq, v_freq, x_time = extract_features(hacc, vacc, Config.KL_ESTIMATOR)
+    return h_freq, v_freq, x_time
 
-def update_csv(bearing_number, monitoring_time, df_freq, df_time, filename='bearing_predictions.csv'):
+def update_csv(bearing_number, monitoring_time, h_freq, v_freq, x_time, filename='bearing_predictions.csv'):
     # Prepare the data to be appended
-    json_df_freq = df_freq.iloc[[0]].to_json(orient='records')
-    json_df_time = df_time.iloc[[0]].to_json(orient='records')
+    df_freq = pd.DataFrame([np.concatenate((h_freq, v_freq))], columns=FREQUENCY_COLUMNS)
+    df_time = pd.DataFrame([x_time], columns=TIME_COLUMNS)
+    json_df_freq = df_freq.to_json(orient='records')
+    json_df_time = df_time.to_json(orient='records')
     
     # Create a DataFrame with the new row
     new_row = pd.DataFrame({
@@ -44,45 +46,20 @@ def update_csv(bearing_number, monitoring_time, df_freq, df_time, filename='bear
     else:
         # Write the new row to a new CSV file with headers
         new_row.to_csv(filename, mode='w', header=True, index=False)
+
+def log_features(bearing_number, monitoring_time, h_freq, v_freq, x_time):
+    if Config.FEATURE_LOG_FORMAT == "csv":
+        update_csv(bearing_number, monitoring_time, h_freq, v_freq, x_time)
+    else:
+        get_feature_log().append(bearing_number, monitoring_time, h_freq, v_freq, x_time)
     
-@endpoints_bp.route("/api/<model_name>/<int:version>/predict", methods=['POST'])
-def predict(model_name, version):
-    model = ModelLoader.get_model(model_name, version)
-    if not model:
-        return jsonify({"error": "Model not found"}), 404
-        
-    sleep(0.5)    
-    data = request.json    
-    if not data:
-        return jsonify({"error": "No JSON data found"}), 400
-    
-    filtered_data = []
-    directory = None
-    if isinstance(data, list):
-        # Handle the case where data is a list
-        if data and isinstance(data[0], dict) and "Directory" in data[0]:
-            directory = data[0]["Directory"]
-            hours = data[0]["h"]
-            minutes = data[0]["m"]
-            seconds = data[0]["s"]
-            monitoring_time = f"{hours:02}:{minutes:02}:{seconds:02}"
-            #sleep(3)
-        for item in data:
-            if isinstance(item, dict):
-                filtered_item = {key: value for key, value in item.items() if key != "Directory"}
-                filtered_data.append(filtered_item)
-                #sleep(1)
-            else:
-                return jsonify({"error": "List items must be dictionaries"}), 400
-        data_df = pd.DataFrame(filtered_data)
-    df_freq, df_time = feat_eng_single_row(data_df)
-    X_frequency = df_freq.to_numpy()
-    X_time = np.empty((0, 26), float)
-    X_time = np.append(X_time, df_time.values, axis=0)
-    
-    if model is None:
-        return jsonify({"error": "No model available"}), 500
-    bearing_performance_label = model.predict([X_frequency[:, :641], X_frequency[:, 641:], X_time])
+def label_snapshot(model_name, served_version, model, directory, monitoring_time, h_freq, v_freq, x_time):
+    # Labels one snapshot and logs its features; also used by the MQTT inference worker,
+    # so both paths publish the same payload. Concurrent requests for the same model
+    # version share one batched forward pass
+    bearing_performance_label = InferenceBatcher.predict(
+        model_name, served_version, model, [h_freq[np.newaxis], v_freq[np.newaxis], x_time[np.newaxis]]
+    )
     predicted_label = np.argmax(bearing_performance_label, axis=1)
     predicted_string_label = str(predicted_label[0])
     response_data = {
@@ -92,6 +69,48 @@ def predict(model_name, version):
         "label": predicted_string_label 
     }
     print(directory)   
-    update_csv(directory, monitoring_time, df_freq, df_time)
+    log_features(directory, monitoring_time, h_freq, v_freq, x_time)
+    return response_data
+
+@endpoints_bp.route("/api/<model_name>/<int:version>/predict", methods=['POST'])
+def predict(model_name, version):
+    # Never loads a model inside the request: versions are loaded and swapped in by
+    # ModelLoader in the background
+    try:
+        served_version, model = ModelLoader.resolve(model_name, version)
+    except ModelNotFound:
+        return jsonify({"error": "Model not found"}), 404
+    except ModelUnavailable:
+        return jsonify({"error": "Model is loading"}), 503, {"Retry-After": "5"}
+        
+    # Binary snapshots are decoded straight into float32 views of the request body;
+    # anything else is read as deviceSim.py JSON records
+    try:
+        if request.mimetype == SNAPSHOT_CONTENT_TYPE:
+            snapshot = decode_snapshot(request.get_data())
+        else:
+            data = request.json
+            if not data:
+                return jsonify({"error": "No JSON data found"}), 400
+            snapshot = snapshot_from_records(data)
+        check_rows(snapshot)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    directory = snapshot.directory
+    monitoring_time = snapshot.monitoring_time
+    h_freq, v_freq, x_time = feat_eng_single_row(snapshot.hacc, snapshot.vacc)
     
-    return jsonify(response_data),200
\ No newline at end of file
+    if model is None:
+        return jsonify({"error": "No model available"}), 500
+    response_data = label_snapshot(model_name, served_version, model, directory, monitoring_time, h_freq, v_freq, x_time)
+    
+    # Differs from the requested version while that version is still loading
+    return jsonify(response_data), 200, {"X-Served-Version": str(served_version)}
+
+@endpoints_bp.route("/api/batching/metrics", methods=['GET'])
+def batching_metrics():
+    return jsonify(InferenceBatcher.metrics()),200
+
+@endpoints_bp.route("/api/models/cache/metrics", methods=['GET'])
+def model_cache_metrics():
+    return jsonify(ModelLoader.cache_metrics()),200
\ No newline at end of file
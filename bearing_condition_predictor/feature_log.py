@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.single_feat_eng import N_FREQUENCY_BINS, TIME_COLUMNS
+
+# Append-only log of extracted features, replacing the JSON-in-CSV bearing_predictions.csv.
+# Records are fixed width and written back to back into segment_<id>.bin files, so a
+# segment can be memory mapped as a structured array. index.json lists the segments and
+# the global record number each one starts at; the record count of the active segment is
+# its file size // itemsize, so a half written trailing record is never visible.
+
+RECORD_DTYPE = np.dtype([
+    ("frequency", np.float32, (2 * N_FREQUENCY_BINS,)),
+    ("time_domain", np.float32, (len(TIME_COLUMNS),)),
+    ("bearing", "S16"),
+    ("monitoring_time", "S8"),
+    ("logged_at", np.float64),
+])
+
+SEGMENT_RECORDS = 10000
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = "index.lock"
+
+class FeatureLog:
+    def __init__(self, directory, segment_records=SEGMENT_RECORDS):
+        self.directory = directory
+        self.segment_records = segment_records
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        # The Flask process appends/rotates and the feature worker compacts, so index
+        # changes are serialised across processes with a file lock as well
+        with self._lock, open(os.path.join(self.directory, LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"segment_{segment_id:06d}.bin")
+
+    def _read_index(self):
+        path = os.path.join(self.directory, INDEX_FILENAME)
+        if not os.path.exists(path):
+            return {"segments": [{"id": 1, "first_record": 0}]}
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def _write_index(self, index):
+        # Written to a temporary file and renamed so readers never see a partial index
+        path = os.path.join(self.directory, INDEX_FILENAME)
+        with open(path + ".tmp", 'w') as file:
+            json.dump(index, file)
+        os.replace(path + ".tmp", path)
+
+    def _segment_records(self, segment_id):
+        path = self._segment_path(segment_id)
+        return os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+
+    def append(self, bearing_number, monitoring_time, h_freq, v_freq, x_time):
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record["frequency"] = np.concatenate((h_freq, v_freq))
+        record["time_domain"] = x_time
+        record["bearing"] = str(bearing_number).encode()
+        record["monitoring_time"] = str(monitoring_time).encode()
+        record["logged_at"] = time.time()
+
+        with self._locked():
+            index = self._read_index()
+            active = index["segments"][-1]
+            records = self._segment_records(active["id"])
+            if records >= self.segment_records:
+                # Seal the active segment and rotate to a new one
+                active["records"] = records
+                active = {"id": active["id"] + 1, "first_record": active["first_record"] + records}
+                index["segments"].append(active)
+                self._write_index(index)
+                records = 0
+            with open(self._segment_path(active["id"]), 'ab') as file:
+                # Drop a torn trailing record left by an interrupted write so records stay aligned
+                file.truncate(records * RECORD_DTYPE.itemsize)
+                file.write(record.tobytes())
+                file.flush()
+
+    def total_records(self):
+        # Global number one past the last complete record
+        active = self._read_index()["segments"][-1]
+        return active["first_record"] + self._segment_records(active["id"])
+
+    def _segment_view(self, segment):
+        records = segment.get("records", self._segment_records(segment["id"]))
+        if records == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(self._segment_path(segment["id"]), dtype=RECORD_DTYPE, mode='r', shape=(records,))
+
+    def read(self, start, count):
+        """Return up to count records starting at global record number start.
+
+        The result is a zero-copy view of the memory mapped segment, unless the
+        range spans a segment boundary, in which case the parts are concatenated.
+        """
+        parts = []
+        for segment in self._read_index()["segments"]:
+            view = self._segment_view(segment)
+            first = segment["first_record"]
+            if start + count <= first or start >= first + len(view):
+                continue
+            parts.append(view[max(start - first, 0):start + count - first])
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def compact(self, ingested_records):
+        # Delete sealed segments whose records all lie before ingested_records; the
+        # active segment is never removed and global record numbers do not change
+        with self._locked():
+            index = self._read_index()
+            kept = []
+            for segment in index["segments"][:-1]:
+                if segment["first_record"] + segment["records"] <= ingested_records:
+                    os.remove(self._segment_path(segment["id"]))
+                    print(f"Compacted feature log segment {segment['id']}")
+                else:
+                    kept.append(segment)
+            if len(kept) != len(index["segments"]) - 1:
+                index["segments"] = kept + index["segments"][-1:]
+                self._write_index(index)
+
+_feature_log = None
+
+def get_feature_log():
+    global _feature_log
+    if _feature_log is None:
+        _feature_log = FeatureLog(Config.FEATURE_LOG_DIR)
+    return _feature_log
@@ -1,107 +1,401 @@
 import os
-import hopsworks
 import shutil
-import tensorflow as tf
-from tensorflow import keras
-import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import redis
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.numpy_engine import NumpyModel, export_weights, weights_filename
+from bearing_condition_predictor.model_cache import ModelCache
+from bearing_condition_predictor.batching import InferenceBatcher
+from bearing_condition_predictor.model_artifacts import ArtifactManifest, remove_artifact
+from bearing_condition_predictor.config_client import get_config_client
+
+_project = None
+_project_lock = threading.Lock()
+
+def get_project():
+    # Logs in to Hopsworks on first use, or opens the local feature store and model
+    # registry with FEATURE_STORE=local; None in offline mode with no local store
+    global _project
+    with _project_lock:
+        if _project is None:
+            if Config.FEATURE_STORE == "local":
+                from bearing_condition_predictor.local_feature_store import LocalProject
+                _project = LocalProject(Config.LOCAL_FEATURE_STORE_DIR)
+            elif not Config.OFFLINE:
+                import hopsworks
+                _project = hopsworks.login(api_key_value=Config.HOPSWORKS_API_KEY)
+    return _project
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_model_manifest():
+    # Checksums of the artifacts under ModelLoader.LOCAL_MODEL_BASE_DIR, shared by the
+    # loader threads of this process
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = ArtifactManifest(ModelLoader.LOCAL_MODEL_BASE_DIR)
+    return _manifest
+
+def get_feature_groups_loader():
+    project = get_project()
+    if project is None:
+        raise RuntimeError("Feature groups are not available in offline mode without FEATURE_STORE=local")
+    return FeatureGroupsLoader(project)
+
+class ModelNotFound(Exception):
+    pass
+
+class ModelUnavailable(Exception):
+    pass
+
+class _DownloadRequired(Exception):
+    # Raised by a local-only load whose cached artifacts are missing or corrupt
+    pass
 
 class ModelLoader:
     _instance = None
+    _lock = threading.Lock()
 
     LOCAL_MODEL_BASE_DIR = "bearing_condition_predictor/local_model"
+    # Minimum seconds between config refreshes triggered by requests for unknown versions
+    REFRESH_INTERVAL = 5.0
+    # Seconds spent downloading and loading each version, by "model_subdirectory/version"
+    load_times = {}
 
     def __new__(cls, project, redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings'):
-        if cls._instance is None:
-            cls._instance = super(ModelLoader, cls).__new__(cls)
-            cls._instance.project = project
-            cls._instance.redis_host = redis_host
-            cls._instance.redis_port = redis_port
-            cls._instance.redis_db = redis_db
-            cls._instance.redis_key = redis_key
-            cls._instance.config = cls._load_config_from_redis(redis_host, redis_port, redis_db, redis_key)
-            cls._instance.models = cls._load_all_models(cls._instance.project, cls._instance.config)
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(ModelLoader, cls).__new__(cls)
+                instance.project = project
+                instance.redis_host = redis_host
+                instance.redis_port = redis_port
+                instance.redis_db = redis_db
+                instance.redis_key = redis_key
+                instance.config_client = get_config_client(redis_host, redis_port, redis_db, redis_key)
+                instance.config = instance.config_client.get()
+                if instance.config is None:
+                    raise Exception(f"No configuration found in Redis for key: {redis_key}")
+                # Versions are loaded off the request path and swapped in when ready
+                instance._swap_lock = threading.Lock()
+                instance._loading = set()
+                instance._reload_locks = {}
+                instance.entries = cls._config_entries(instance.config)
+                # An evicted version's batching queue goes with it
+                instance.models = ModelCache(Config.MODEL_CACHE_MAX_BYTES,
+                                             on_evict=lambda key: InferenceBatcher.remove(*key))
+                instance.models.pin(cls._pinned_keys(instance.config))
+                cls._load_all_models(instance)
+                instance._last_refresh = 0.0
+                instance._executor = ThreadPoolExecutor(max_workers=Config.MODEL_LOAD_WORKERS,
+                                                        thread_name_prefix="model-loader")
+                # ModelTrainer publishes each new version through the config client
+                instance.config_client.add_listener(instance.refresh)
+                # Picks up versions published while the pinned ones were loading
+                instance.refresh(instance.config_client.get())
+                cls._instance = instance
         return cls._instance
     
     @staticmethod
-    def _load_config_from_redis(redis_host, redis_port, redis_db, redis_key):
-        r = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
-        config_data_str = r.get(redis_key)
-        if config_data_str is None:
-            raise Exception(f"No configuration found in Redis for key: {redis_key}")
-        config = json.loads(config_data_str)
-        return config
+    def _config_entries(config):
+        # (model_subdirectory, version) -> (model_name, model_info) for every listed version
+        return {(model_info["model_subdirectory"], model_info["version"]): (model_name, model_info)
+                for model_name, model_infos in config["MODELS"].items() for model_info in model_infos}
+
+    @staticmethod
+    def _pinned_keys(config):
+        # The newest MODEL_CACHE_PINNED_VERSIONS versions of each model: the one clients
+        # are routed to, and the ones kept for serving while it warms up
+        pinned = set()
+        for model_infos in config["MODELS"].values():
+            newest = sorted(model_infos, key=lambda model_info: model_info["version"])[-Config.MODEL_CACHE_PINNED_VERSIONS:]
+            pinned.update((model_info["model_subdirectory"], model_info["version"]) for model_info in newest)
+        return pinned
+
+    @staticmethod
+    def _local_paths(model_info):
+        local_model_path = os.path.join(ModelLoader.LOCAL_MODEL_BASE_DIR, model_info["model_subdirectory"],
+                                        str(model_info["version"]), model_info["filename"])
+        local_weights_path = os.path.join(os.path.dirname(local_model_path), weights_filename(model_info["filename"]))
+        return local_model_path, local_weights_path
+
+    @staticmethod
+    def _load_model(project, model_name, model_info, allow_download=True):
+        # Returns the serving model for one config entry, or None if it cannot be found.
+        # Cached artifacts are used only if they match their manifest checksum; otherwise,
+        # or if loading them fails, they are downloaded from the model registry again.
+        # With allow_download=False that raises _DownloadRequired instead
+        key = f"{model_info['model_subdirectory']}/{model_info['version']}"
+        version = model_info["version"]
+        local_model_path, local_weights_path = ModelLoader._local_paths(model_info)
+        manifest = get_model_manifest()
+        # Without a registry nothing can be fetched again, so unrecorded artifacts are trusted
+        offline = project is None
+
+        downloaded = False
+        start = time.perf_counter()
+        if Config.MODEL_SERVING == "numpy" and manifest.verify(local_weights_path, trust_unrecorded=offline):
+            print(f"Found local NumPy weights: {model_name} version: {version}")
+        elif manifest.verify(local_model_path, trust_unrecorded=offline):
+            print(f"Found local model: {model_name} version: {version}")
+            if Config.MODEL_SERVING == "numpy":
+                # Weights that failed verification are exported again from the model
+                manifest.discard(local_weights_path)
+                remove_artifact(local_weights_path)
+        elif offline:
+            print(f"Model {model_name} version {version} is not cached locally and Hopsworks is offline.")
+            return None
+        elif not allow_download:
+            raise _DownloadRequired()
+        elif ModelLoader._download_model(project, model_name, model_info):
+            downloaded = True
+        else:
+            return None
+        download_seconds = time.perf_counter() - start if downloaded else 0.0
+
+        start = time.perf_counter()
+        try:
+            model = ModelLoader._load_serving_model(local_model_path, local_weights_path)
+        except Exception as e:
+            if offline or downloaded:
+                raise
+            if not allow_download:
+                raise _DownloadRequired() from e
+            print(f"Loading cached {model_name} version {version} failed ({e}), downloading it again")
+            start = time.perf_counter()
+            if not ModelLoader._download_model(project, model_name, model_info):
+                return None
+            download_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            model = ModelLoader._load_serving_model(local_model_path, local_weights_path)
+        load_seconds = time.perf_counter() - start
+
+        ModelLoader.load_times[key] = {"download_seconds": round(download_seconds, 3),
+                                       "load_seconds": round(load_seconds, 3)}
+        print(f"{model_name} version {version}: downloaded in {download_seconds:.2f}s, loaded in {load_seconds:.2f}s")
+        return model
+
+    @staticmethod
+    def _download_model(project, model_name, model_info):
+        # Replaces the cached artifacts of one version with fresh copies from the model
+        # registry and records their checksums; False if the registry does not have it
+        version = model_info["version"]
+        model_filename = model_info["filename"]
+        local_model_path, local_weights_path = ModelLoader._local_paths(model_info)
+        manifest = get_model_manifest()
+
+        mr = project.get_model_registry()
+        retrieved_model = mr.get_model(name=model_name, version=version)
+        if retrieved_model is None:
+            print(f"Model {model_name} version {version} not found in model registry.")
+            return False
+
+        saved_model_dir = retrieved_model.download()
+        temp_model_path = os.path.join(saved_model_dir, model_filename)
+        temp_weights_path = os.path.join(saved_model_dir, weights_filename(model_filename))
+
+        if not os.path.exists(temp_model_path):
+            print(f"Model file {temp_model_path} does not exist.")
+            return False
+
+        os.makedirs(os.path.dirname(local_model_path), exist_ok=True)
+        # Stale weights must not outlive the model they were exported from
+        for path in (local_model_path, local_weights_path):
+            manifest.discard(path)
+            remove_artifact(path)
+
+        shutil.move(temp_model_path, local_model_path)
+        manifest.record(local_model_path)
+        if os.path.exists(temp_weights_path):
+            shutil.move(temp_weights_path, local_weights_path)
+            manifest.record(local_weights_path)
+        print(f"Downloaded {model_name} version {version} to {local_model_path}.")
+        return True
+
+    @staticmethod
+    def _load_all_models(instance):
+        # Only the pinned versions are loaded up front, MODEL_LOAD_WORKERS at a time, and
+        # only from local artifacts since this may run on the first request; the ones that
+        # need a download are queued by the refresh() that follows. The rest load when
+        # first requested
+        print(instance.config)
+        keys = sorted(ModelLoader._pinned_keys(instance.config))
+
+        def load(key):
+            try:
+                return ModelLoader._load_model(instance.project, *instance.entries[key], allow_download=False)
+            except _DownloadRequired:
+                print(f"{key[0]} version {key[1]} is not cached locally, downloading it in the background")
+                return None
+            except Exception as e:
+                print(f"Loading {key[0]} version {key[1]} failed: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=Config.MODEL_LOAD_WORKERS, thread_name_prefix="model-loader") as executor:
+            for key, model in zip(keys, executor.map(load, keys)):
+                if model is not None:
+                    instance.models.put(key, model)
+                    print(f"Loaded {key[0]} version {key[1]}")
 
     @staticmethod
-    def _load_all_models(project, config):
-        models = {}
-        print(config)
-        for model_name, model_infos in config["MODELS"].items():
-            models[model_name] = {}
-            for model_info in model_infos:
-                version = model_info["version"]
-                model_filename = model_info["filename"]
-                model_subdirectory = model_info["model_subdirectory"]
-                local_model_path = os.path.join(ModelLoader.LOCAL_MODEL_BASE_DIR, model_subdirectory, str(version), model_filename)
-
-                if os.path.exists(local_model_path):
-                    print(f"Found local model: {model_name} version: {version}")
-                    model = tf.keras.models.load_model(local_model_path)
-                else:
-                    mr = project.get_model_registry()
-                    retrieved_model = mr.get_model(name=model_name, version=version)
-                    if retrieved_model is None:
-                        print(f"Model {model_name} version {version} not found in model registry.")
-                        continue
-
-                    saved_model_dir = retrieved_model.download()
-                    temp_model_path = os.path.join(saved_model_dir, model_filename)
-
-                    if not os.path.exists(temp_model_path):
-                        print(f"Model file {temp_model_path} does not exist.")
-                        continue
-
-                    if not os.path.exists(os.path.dirname(local_model_path)):
-                        os.makedirs(os.path.dirname(local_model_path))
-
-                    shutil.move(temp_model_path, local_model_path)
-                    print(f"Loading model from {local_model_path}.")
-                    model = tf.keras.models.load_model(local_model_path)
-
-                models[model_subdirectory][version] = model
-                print(models)
-
-        return models
+    def _load_serving_model(local_model_path, local_weights_path):
+        if Config.MODEL_SERVING == "numpy" and os.path.exists(local_weights_path):
+            return NumpyModel.load(local_weights_path)
+
+        # TensorFlow is only imported when a Keras model actually has to be loaded
+        import tensorflow as tf
+        model = tf.keras.models.load_model(local_model_path)
+        if Config.MODEL_SERVING == "numpy":
+            # Versions registered before the NumPy export existed are exported once here
+            export_weights(model, local_weights_path)
+            get_model_manifest().record(local_weights_path)
+            return NumpyModel.load(local_weights_path)
+
+        from bearing_condition_predictor.serving import compile_for_serving
+        # Traced/converted and warmed up once here so requests never pay for it
+        return compile_for_serving(model, Config.MODEL_SERVING)
+
+    def refresh(self, config):
+        # Takes the updated config, moves the pins to the newest versions and queues each
+        # pinned version that is neither loaded nor loading; returns immediately
+        if config is None:
+            return
+        pinned = self._pinned_keys(config)
+        with self._swap_lock:
+            self.config = config
+            removed = set(self.entries)
+            self.entries = self._config_entries(config)
+            removed -= set(self.entries)
+            self._last_refresh = time.monotonic()
+            for key in sorted(pinned):
+                if key in self.models or key in self._loading:
+                    continue
+                self._loading.add(key)
+                self._executor.submit(self._load_in_background, *self.entries[key])
+        # Versions no longer in the config are not served again
+        for key in removed:
+            self.models.discard(key)
+            InferenceBatcher.remove(*key)
+        self.models.pin(pinned)
+
+    def _load_in_background(self, model_name, model_info):
+        key = (model_info["model_subdirectory"], model_info["version"])
+        try:
+            model = self._load_model(self.project, model_name, model_info)
+        except Exception as e:
+            print(f"Loading {key[0]} version {key[1]} failed: {e}")
+            model = None
+        if model is not None:
+            # Becomes visible to requests in one step, only once fully loaded
+            self.models.put(key, model)
+            print(f"Swapped in {key[0]} version {key[1]}")
+        with self._swap_lock:
+            self._loading.discard(key)
+
+    def _reload(self, key, model_name, model_info):
+        # Lazy reload of an evicted version from LOCAL_MODEL_BASE_DIR. Only requests for
+        # this version wait on it, and never on the registry: a version whose cached
+        # artifacts are missing or fail verification is downloaded in the background
+        # instead, like a new version, and None is returned until then
+        with self._swap_lock:
+            reload_lock = self._reload_locks.setdefault(key, threading.Lock())
+        with reload_lock:
+            model = self.models.peek(key)
+            if model is None:
+                try:
+                    model = self._load_model(self.project, model_name, model_info, allow_download=False)
+                except _DownloadRequired:
+                    with self._swap_lock:
+                        if key not in self._loading:
+                            self._loading.add(key)
+                            self._executor.submit(self._load_in_background, model_name, model_info)
+                    return None
+                if model is None:
+                    return None
+                self.models.put(key, model)
+                print(f"Reloaded {key[0]} version {key[1]}")
+        return model
+
+    def _request_refresh(self):
+        # A request for an unknown version may mean a missed notification; refresh in the
+        # background, at most once per REFRESH_INTERVAL
+        with self._swap_lock:
+            if time.monotonic() - self._last_refresh < self.REFRESH_INTERVAL:
+                return
+            self._last_refresh = time.monotonic()
+        self._executor.submit(self.config_client.refresh)
 
     @classmethod
-    def get_model(cls, model_subdirectory, version):
+    def resolve(cls, model_subdirectory, version):
+        """Return (served_version, model) for a request.
+
+        While a version is still loading, requests for it are served by the newest
+        loaded earlier version of the same model. Listed versions evicted from the
+        cache are reloaded from local disk. Raises ModelUnavailable if there is no
+        model to serve yet, and ModelNotFound for versions that are not in the config.
+        """
         instance = cls._instance
         if not instance:
-            raise Exception("ModelLoader instance not initialized.")
-
-        model = instance.models.get(model_subdirectory, {}).get(int(version))
-        if model is None:
-            # Reload the configuration from Redis
-            instance.config = cls._load_config_from_redis(instance.redis_host, instance.redis_port, instance.redis_db, instance.redis_key)
-            # Reload all models if the requested version is not found
-            instance.models = cls._load_all_models(instance.project, instance.config)
-            print(instance.models)
-            model = instance.models.get(model_subdirectory, {}).get(int(version))
+            # Models are loaded by the first request rather than at import time
+            instance = cls(get_project())
+
+        version = int(version)
+        key = (model_subdirectory, version)
+        model = instance.models.get(key)
+        if model is not None:
+            return version, model
+
+        with instance._swap_lock:
+            loading = key in instance._loading
+            entry = instance.entries.get(key)
+        if loading:
+            previous = [v for v in instance.models.versions(model_subdirectory) if v < version]
+            if previous:
+                model = instance.models.peek((model_subdirectory, max(previous)))
+                if model is not None:
+                    return max(previous), model
+            raise ModelUnavailable(f"Model {model_subdirectory} version {version} is still loading")
+        if entry is not None:
+            # Listed in the config but evicted from the cache
+            model = instance._reload(key, *entry)
             if model is None:
-                raise Exception(f"Model {model_subdirectory} version {version} not found after reloading.")
-        
-        return model
+                raise ModelUnavailable(f"Model {model_subdirectory} version {version} is being downloaded")
+            return version, model
+
+        instance._request_refresh()
+        raise ModelNotFound(f"Model {model_subdirectory} version {version} not found")
 
+    @classmethod
+    def get_model(cls, model_subdirectory, version):
+        return cls.resolve(model_subdirectory, version)[1]
+
+    @classmethod
+    def cache_metrics(cls):
+        instance = cls._instance
+        if not instance:
+            return {}
+        return dict(instance.models.metrics(), load_times=dict(cls.load_times))
 
 class FeatureGroupsLoader:
     _instance = None
+    _lock = threading.Lock()
+
+    # Next free 'index' value, shared by every process through Redis
+    REDIS_INDEX_KEY = 'db:next_index'
+    # Index ranges reserved for chunks whose upload has not completed yet
+    REDIS_RESERVATIONS_KEY = 'db:index_reservations'
 
-    def __new__(cls, project):
-        if cls._instance is None:
-            cls._instance = super(FeatureGroupsLoader, cls).__new__(cls)
-            cls._instance.project = project
-            cls._instance._load_feature_groups()
-            cls._instance._update_max_index_value()
+    def __new__(cls, project, redis_host='localhost', redis_port=6379, redis_db=0):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(FeatureGroupsLoader, cls).__new__(cls)
+                instance.project = project
+                instance.redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
+                instance._load_feature_groups()
+                cls._instance = instance
         return cls._instance
 
     def _load_feature_groups(self):
@@ -112,17 +406,48 @@ class FeatureGroupsLoader:
         self.fg_frequency_3 = self.fs.get_feature_group(name="frequency_domain_features_3", version=1)
         self.fg_time_domain = self.fs.get_feature_group(name="time_domain_features", version=1)
 
-    def _update_max_index_value(self):
-        combined_df = self.fg_time_domain.select_all().read(read_options={"use_hive": True})
-        max_value = combined_df['index'].max()
-        self.current_index_value = max_value + 1
+    def _seed_index_counter(self):
+        # Only runs the first time a range is reserved and the counter is not in Redis yet;
+        # reads just the index column, and SETNX keeps the first seed if processes race
+        if self.redis_client.exists(self.REDIS_INDEX_KEY):
+            return
+        index_df = self.fg_time_domain.select(["index"]).read(read_options={"use_hive": True})
+        next_index = int(index_df['index'].max()) + 1 if len(index_df) else 0
+        self.redis_client.setnx(self.REDIS_INDEX_KEY, next_index)
 
     def get_feature_groups(self):
         return self.fg_frequency_0, self.fg_frequency_1, self.fg_frequency_2, self.fg_frequency_3, self.fg_time_domain
 
+    def reserve_index_range(self, count, reservation=None):
+        """Atomically reserve count consecutive index values and return the first.
+
+        reservation names the chunk being uploaded; reserving again under the same
+        name, e.g. when an upload interrupted by a crash is retried, returns the same
+        range so the retried inserts overwrite rather than duplicate. An upload that
+        fails releases its range instead.
+        """
+        if reservation is not None:
+            reserved = self.redis_client.hget(self.REDIS_RESERVATIONS_KEY, reservation)
+            if reserved is not None:
+                return int(reserved)
+        self._seed_index_counter()
+        start = self.redis_client.incrby(self.REDIS_INDEX_KEY, count) - count
+        if reservation is not None:
+            self.redis_client.hset(self.REDIS_RESERVATIONS_KEY, reservation, start)
+        return start
+
+    def release_reservation(self, reservation):
+        self.redis_client.hdel(self.REDIS_RESERVATIONS_KEY, reservation)
+
+    def lowest_pending_index(self):
+        # Start of the lowest range reserved by an upload that has not completed, or None
+        reserved = self.redis_client.hvals(self.REDIS_RESERVATIONS_KEY)
+        return min(int(start) for start in reserved) if reserved else None
+
     def get_current_index_value(self):
-        return self.current_index_value
+        self._seed_index_counter()
+        return int(self.redis_client.get(self.REDIS_INDEX_KEY))
 
     def increment_index_value(self, increment_by):
-        self.current_index_value += increment_by
-        return self.current_index_value
\ No newline at end of file
+        self._seed_index_counter()
+        return self.redis_client.incrby(self.REDIS_INDEX_KEY, increment_by)
@@ -0,0 +1,65 @@
+import argparse
+import time
+import numpy as np
+
+from bearing_condition_predictor.single_feat_eng import decimate, distribution_features
+from bearing_condition_predictor.batch_feat_eng import load_femto_run
+
+# Compares the binned KL estimator against the exact scipy KDE on a FEMTO run:
+#   python -m bearing_condition_predictor.kl_validation Learning_set/Bearing1_1
+
+def compare_estimators(hacc, vacc, estimator="binned"):
+    # Returns {feature: (exact, fast)} arrays over every snapshot, plus the time
+    # spent in each estimator
+    exact = {"Hkl": [], "Hrkl": [], "Vkl": [], "Vrkl": []}
+    fast = {key: [] for key in exact}
+    timings = {"exact": 0.0, estimator: 0.0}
+    for channel, signals in (("H", hacc), ("V", vacc)):
+        for x in decimate(np.asarray(signals, dtype=float)):
+            start = time.perf_counter()
+            _, kl, rkl = distribution_features(x, "exact")
+            timings["exact"] += time.perf_counter() - start
+            exact[channel + "kl"].append(kl)
+            exact[channel + "rkl"].append(rkl)
+
+            start = time.perf_counter()
+            _, kl, rkl = distribution_features(x, estimator)
+            timings[estimator] += time.perf_counter() - start
+            fast[channel + "kl"].append(kl)
+            fast[channel + "rkl"].append(rkl)
+
+    results = {key: (np.array(exact[key]), np.array(fast[key])) for key in exact}
+    return results, timings
+
+def drift_report(results):
+    # Absolute and relative drift per feature, ignoring snapshots where either side is NaN
+    report = {}
+    for key, (exact, fast) in results.items():
+        valid = ~(np.isnan(exact) | np.isnan(fast))
+        abs_drift = np.abs(exact[valid] - fast[valid])
+        rel_drift = abs_drift / np.maximum(np.abs(exact[valid]), np.finfo(float).eps)
+        report[key] = {
+            "snapshots": int(valid.sum()),
+            "max_abs": float(abs_drift.max()) if valid.any() else np.nan,
+            "mean_abs": float(abs_drift.mean()) if valid.any() else np.nan,
+            "max_rel": float(rel_drift.max()) if valid.any() else np.nan,
+            "mean_rel": float(rel_drift.mean()) if valid.any() else np.nan,
+        }
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report KL feature drift of the binned KDE against scipy")
+    parser.add_argument('directory', help="FEMTO bearing run directory containing acc_*.csv snapshots")
+    parser.add_argument('--limit', type=int, default=None, help="Only compare the first N snapshots")
+    args = parser.parse_args()
+
+    hacc, vacc = load_femto_run(args.directory)
+    hacc, vacc = hacc[:args.limit], vacc[:args.limit]
+    results, timings = compare_estimators(hacc, vacc)
+
+    print(f"{'feature':<8}{'n':>6}{'max abs':>12}{'mean abs':>12}{'max rel':>12}{'mean rel':>12}")
+    for key, stats in drift_report(results).items():
+        print(f"{key:<8}{stats['snapshots']:>6}{stats['max_abs']:>12.3e}{stats['mean_abs']:>12.3e}"
+              f"{stats['max_rel']:>12.3e}{stats['mean_rel']:>12.3e}")
+    for estimator, seconds in timings.items():
+        print(f"{estimator}: {seconds:.2f}s over {2 * len(hacc)} channels")
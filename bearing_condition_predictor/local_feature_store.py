@@ -0,0 +1,243 @@
+import os
+import glob
+import json
+import shutil
+import tempfile
+import threading
+from time import sleep, time
+import operator
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+# Local stand-ins for the parts of the Hopsworks project the pipelines use: feature
+# groups with insert/select/join on 'index', feature views with train_test_split and a
+# model registry. Selected with FEATURE_STORE=local so FeatureEngineeringPipeline and
+# ModelTrainer can run end to end without network access.
+#
+#   local_feature_store/
+#       feature_groups/<name>_<version>/part-<n>.parquet
+#       models/<name>/<version>/...
+
+class LocalFeatureGroup:
+    # A feature group stored as one Parquet part per insert under directory, or kept in
+    # memory when directory is None. Rows are keyed by 'index': on read the last insert
+    # of an index wins, like an upsert. insert_latency simulates a slow materialisation
+    # and failures makes that many upcoming inserts raise, so the upload concurrency and
+    # retry handling can be exercised offline.
+
+    def __init__(self, name, version=1, directory=None, insert_latency=0.0, failures=0):
+        self.name = name
+        self.version = version
+        self.directory = directory
+        self.insert_latency = insert_latency
+        self.failures = failures
+        self.frames = []
+        self.insert_calls = 0
+        self.active_inserts = 0
+        self.max_active_inserts = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def insert(self, df, wait=True, overwrite=False):
+        with self._lock:
+            self.insert_calls += 1
+            self.active_inserts += 1
+            self.max_active_inserts = max(self.max_active_inserts, self.active_inserts)
+            fail = self.failures > 0
+            if fail:
+                self.failures -= 1
+        try:
+            sleep(self.insert_latency)
+            if fail:
+                raise ConnectionError(f"Simulated insert failure for {self.name}")
+            with self._lock:
+                if overwrite:
+                    self.frames = []
+                    for part in self._parts():
+                        os.remove(part)
+                if self.directory is None:
+                    self.frames.append(df.copy())
+                else:
+                    # Written under a temporary name and renamed so readers never see a partial part
+                    path = os.path.join(self.directory, f"part-{time():.6f}-{threading.get_ident()}.parquet")
+                    df.to_parquet(path + ".tmp", index=False)
+                    os.replace(path + ".tmp", path)
+        finally:
+            with self._lock:
+                self.active_inserts -= 1
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.directory, "part-*.parquet"))) if self.directory else []
+
+    def read(self, columns=None, filters=()):
+        if self.directory is None:
+            with self._lock:
+                frames = [df if columns is None else df[columns] for df in self.frames]
+            for f in filters:
+                frames = [df[f.mask(df)] for df in frames]
+        else:
+            # One multi-threaded scan over every part, in insert order, with the filters
+            # pushed down so only matching row groups are decoded
+            parts = self._parts()
+            expression = None
+            for f in filters:
+                expression = f.expression() if expression is None else expression & f.expression()
+            frames = [ds.dataset(parts, format="parquet").to_table(columns=columns, filter=expression).to_pandas()] if parts else []
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if 'index' in df.columns:
+            df = df.drop_duplicates(subset='index', keep='last')
+        return df
+
+    def get_feature(self, name):
+        return LocalFeature(name)
+
+    def select_all(self):
+        return LocalQuery([(self, None)])
+
+    def select(self, features):
+        features = list(features)
+        # The join key is always read so selections can be joined
+        return LocalQuery([(self, features if 'index' in features else features + ['index'])])
+
+class LocalFilter:
+    def __init__(self, name, op, value):
+        self.name = name
+        self.op = op
+        self.value = value
+
+    def expression(self):
+        return self.op(ds.field(self.name), self.value)
+
+    def mask(self, df):
+        return self.op(df[self.name], self.value).to_numpy()
+
+class LocalFeature:
+    # Comparisons build filters for LocalQuery.filter, like hsfs Feature objects
+    def __init__(self, name):
+        self.name = name
+
+    def __gt__(self, value):
+        return LocalFilter(self.name, operator.gt, value)
+
+    def __ge__(self, value):
+        return LocalFilter(self.name, operator.ge, value)
+
+    def __lt__(self, value):
+        return LocalFilter(self.name, operator.lt, value)
+
+    def __le__(self, value):
+        return LocalFilter(self.name, operator.le, value)
+
+class LocalQuery:
+    def __init__(self, selections, filters=()):
+        self.selections = selections
+        self.filters = list(filters)
+
+    def join(self, other, on="index"):
+        if on != "index":
+            raise ValueError("The local feature store only joins on 'index'")
+        return LocalQuery(self.selections + other.selections, self.filters + other.filters)
+
+    def filter(self, local_filter):
+        # Only filters on 'index' are supported, since they apply to every joined group
+        if local_filter.name != "index":
+            raise ValueError("The local feature store only filters on 'index'")
+        return LocalQuery(self.selections, self.filters + [local_filter])
+
+    def read(self, read_options=None, dataframe_type="default"):
+        # Each group is indexed and sorted by 'index' and the groups are aligned with one
+        # inner concat, which stays a linear merge for millions of rows
+        frames = []
+        for feature_group, columns in self.selections:
+            df = feature_group.read(columns, self.filters)
+            if 'index' not in df.columns:
+                df['index'] = pd.Series(dtype=np.int64)
+            frames.append(df.set_index('index').sort_index())
+        joined = frames[0] if len(frames) == 1 else pd.concat(frames, axis=1, join='inner')
+        return joined.reset_index()
+
+class LocalFeatureView:
+    def __init__(self, name, version, query, labels):
+        self.name = name
+        self.version = version
+        self.query = query
+        self.labels = labels
+
+    def train_test_split(self, test_size, description=None, primary_keys=False, read_options=None, seed=0):
+        df = self.query.read()
+        shuffled = np.random.default_rng(seed).permutation(len(df))
+        n_test = int(round(test_size * len(df)))
+        train, test = df.iloc[np.sort(shuffled[n_test:])], df.iloc[np.sort(shuffled[:n_test])]
+        X_train = train.drop(columns=self.labels).reset_index(drop=True)
+        X_test = test.drop(columns=self.labels).reset_index(drop=True)
+        y_train = train[self.labels].reset_index(drop=True)
+        y_test = test[self.labels].reset_index(drop=True)
+        return X_train, X_test, y_train, y_test
+
+class LocalFeatureStore:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._feature_groups = {}
+        self._lock = threading.Lock()
+
+    def get_feature_group(self, name, version=1):
+        with self._lock:
+            key = (name, version)
+            if key not in self._feature_groups:
+                directory = os.path.join(self.base_dir, "feature_groups", f"{name}_{version}")
+                self._feature_groups[key] = LocalFeatureGroup(name, version, directory)
+            return self._feature_groups[key]
+
+    def get_or_create_feature_view(self, name, version, query, labels):
+        return LocalFeatureView(name, version, query, labels)
+
+class LocalModel:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def download(self):
+        # A copy, since ModelLoader moves files out of the downloaded directory
+        target = tempfile.mkdtemp(prefix="local_model_")
+        shutil.copytree(self.directory, target, dirs_exist_ok=True)
+        return target
+
+class LocalModelEntry:
+    def __init__(self, directory, metadata):
+        self.directory = directory
+        self.metadata = metadata
+
+    def save(self, model_dir):
+        shutil.copytree(model_dir, self.directory, dirs_exist_ok=True)
+        with open(os.path.join(self.directory, "metadata.json"), 'w') as file:
+            json.dump(self.metadata, file, default=str)
+
+class LocalModelRegistry:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        # Mirrors the mr.tensorflow.create_model entry point of the Hopsworks registry
+        self.tensorflow = self
+
+    def create_model(self, name, version, description=None, model_schema=None, metrics=None, **kwargs):
+        metadata = {"name": name, "version": version, "description": description, "metrics": metrics}
+        if model_schema is not None and hasattr(model_schema, "to_dict"):
+            metadata["model_schema"] = model_schema.to_dict()
+        return LocalModelEntry(os.path.join(self.base_dir, name, str(version)), metadata)
+
+    def get_model(self, name, version):
+        directory = os.path.join(self.base_dir, name, str(version))
+        return LocalModel(directory) if os.path.isdir(directory) else None
+
+class LocalProject:
+    def __init__(self, base_dir):
+        self.feature_store = LocalFeatureStore(base_dir)
+        self.model_registry = LocalModelRegistry(os.path.join(base_dir, "models"))
+
+    def get_feature_store(self):
+        return self.feature_store
+
+    def get_model_registry(self):
+        return self.model_registry
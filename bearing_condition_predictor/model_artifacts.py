@@ -0,0 +1,112 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# Content checksums of the model artifacts cached under LOCAL_MODEL_BASE_DIR, kept in
+# manifest.json there and keyed by path relative to it:
+#
+#   {"bearing_model/5/AE_classifier.pkl": {"sha256": "...", "bytes": 447390}, ...}
+#
+# An artifact is recorded only after it has been moved into place, so one left partial
+# by an interrupted download has no entry, and one corrupted since fails its checksum.
+
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = "manifest.lock"
+CHUNK_BYTES = 1 << 20
+
+def artifact_checksum(path):
+    # SHA-256 of a file, or of every file of a directory (such as a SavedModel) in
+    # sorted order together with its relative path; returns (hexdigest, total bytes)
+    digest = hashlib.sha256()
+    total = 0
+    if os.path.isdir(path):
+        files = sorted(os.path.relpath(os.path.join(root, name), path)
+                       for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [None]
+    for relative in files:
+        file_path = path if relative is None else os.path.join(path, relative)
+        if relative is not None:
+            digest.update(relative.encode())
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(CHUNK_BYTES), b''):
+                digest.update(block)
+                total += len(block)
+    return digest.hexdigest(), total
+
+def remove_artifact(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+class ArtifactManifest:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        # Several gateway processes may share the model directory
+        with self._lock, open(os.path.join(self.base_dir, LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _key(self, path):
+        return os.path.relpath(path, self.base_dir)
+
+    def _read(self):
+        path = os.path.join(self.base_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def _write(self, manifest):
+        path = os.path.join(self.base_dir, MANIFEST_FILENAME)
+        with open(path + ".tmp", 'w') as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def record(self, path):
+        checksum, nbytes = artifact_checksum(path)
+        with self._locked():
+            manifest = self._read()
+            manifest[self._key(path)] = {"sha256": checksum, "bytes": nbytes}
+            self._write(manifest)
+
+    def discard(self, path):
+        with self._locked():
+            manifest = self._read()
+            if manifest.pop(self._key(path), None) is not None:
+                self._write(manifest)
+
+    def verify(self, path, trust_unrecorded=False):
+        """True if path exists and matches its recorded checksum.
+
+        An artifact with no entry fails unless trust_unrecorded, in which case it is
+        recorded as it is; used when it cannot be fetched again anyway.
+        """
+        if not os.path.exists(path):
+            return False
+        with self._locked():
+            entry = self._read().get(self._key(path))
+        if entry is None:
+            if not trust_unrecorded:
+                print(f"{path} has no checksum in the manifest")
+                return False
+            self.record(path)
+            return True
+        checksum, nbytes = artifact_checksum(path)
+        if checksum != entry["sha256"] or nbytes != entry["bytes"]:
+            print(f"{path} does not match its checksum")
+            return False
+        return True
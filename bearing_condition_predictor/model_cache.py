@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Loaded model versions held within a byte budget, least recently used evicted first.
+# Pinned versions, the ones currently being served, are never evicted. on_evict(key) is
+# called, outside the cache lock, for every version that leaves the cache.
+
+def estimate_nbytes(model):
+    # Size of the parameters: the exported arrays of a NumpyModel, otherwise the weights
+    # of the Keras model behind the serving wrapper. TFLite models keep both the Keras
+    # model and the converted flatbuffer, so they count twice.
+    if hasattr(model, "arrays"):
+        return sum(array.nbytes for array in model.arrays.values())
+    keras_model = getattr(model, "keras_model", model)
+    nbytes = sum(int(np.prod(weight.shape)) * weight.dtype.size for weight in keras_model.weights)
+    return nbytes * 2 if hasattr(model, "interpreter") else nbytes
+
+class ModelCache:
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, model):
+        nbytes = estimate_nbytes(model)
+        with self._lock:
+            self._entries[key] = (model, nbytes)
+            self._entries.move_to_end(key)
+            self.loads += 1
+            # The version just loaded is about to serve a request, so it is kept even if
+            # that leaves the cache over budget until the next load
+            evicted = self._evict(keep=key)
+        self._notify(evicted)
+
+    def pin(self, keys):
+        # Replaces the pinned set; versions that are no longer pinned become evictable
+        with self._lock:
+            self._pinned = set(keys)
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def discard(self, key):
+        # Drops a version regardless of the budget, e.g. once it is removed from the config
+        with self._lock:
+            evicted = [key] if self._entries.pop(key, None) is not None else []
+        self._notify(evicted)
+
+    def _evict(self, keep=None):
+        evicted = []
+        total = sum(nbytes for _, nbytes in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key in self._pinned or key == keep:
+                continue
+            total -= self._entries.pop(key)[1]
+            self.evictions += 1
+            evicted.append(key)
+            print(f"Evicted model {key[0]} version {key[1]} from the model cache")
+        if total > self.max_bytes:
+            print(f"Model cache holds {total} bytes, over its {self.max_bytes} byte budget")
+        return evicted
+
+    def _notify(self, evicted):
+        if self.on_evict is not None:
+            for key in evicted:
+                self.on_evict(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def versions(self, model_subdirectory):
+        # Cached versions of a model, without counting as a use
+        with self._lock:
+            return [version for name, version in self._entries if name == model_subdirectory]
+
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(nbytes for _, nbytes in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "pinned": sorted(f"{name}/{version}" for name, version in self._pinned),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loads": self.loads,
+            }
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import numpy as np
+import pandas as pd
+import paho.mqtt.client as mqtt
+
+from bearing_condition_predictor.config import Config
+from snapshot_format import SNAPSHOT_ROWS, encode_snapshot
+
+# End-to-end latency, from publishing a snapshot on bearing/sendData to receiving its
+# label on bearing/label, of the HTTP path (mqttClient.py bridge + Flask server) and the
+# in-process worker. Each path is started in turn, run against the same snapshots and
+# stopped again; needs the MQTT broker and Redis running, and is run from the
+# directory the servers are normally started from:
+#   python -m bearing_condition_predictor.mqtt_benchmark
+# The HTTP path runs first: its Flask server loads config.json into Redis, which the
+# worker reads at startup.
+
+SEND_TOPIC = 'bearing/sendData'
+LABEL_TOPIC = 'bearing/label'
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = {
+    "http": [[sys.executable, os.path.join(REPO_DIR, "run.py")],
+             [sys.executable, os.path.join(REPO_DIR, "mqttClient.py")]],
+    "worker": [[sys.executable, "-m", "bearing_condition_predictor.mqtt_worker"]],
+}
+
+def synthetic_snapshot(bearing, sequence, rng, snapshot_format="json"):
+    # Same payloads as deviceSim.py; the time fields number the snapshots of a bearing
+    if snapshot_format == "binary":
+        return encode_snapshot(bearing, sequence // 3600, sequence // 60 % 60, sequence % 60, 0.0,
+                               rng.normal(size=SNAPSHOT_ROWS), rng.normal(size=SNAPSHOT_ROWS))
+    df = pd.DataFrame({
+        "h": sequence // 3600, "m": sequence // 60 % 60, "s": sequence % 60,
+        "ms": np.arange(SNAPSHOT_ROWS, dtype=float),
+        "Hacc": rng.normal(size=SNAPSHOT_ROWS), "Vacc": rng.normal(size=SNAPSHOT_ROWS),
+    })
+    df["Directory"] = bearing
+    return df.to_json(orient='records')
+
+def snapshot_time(sequence):
+    return f"{sequence // 3600:02}:{sequence // 60 % 60:02}:{sequence % 60:02}"
+
+class LabelListener:
+    # Publishes snapshots and records when the label of each (bearing, time) comes back
+
+    def __init__(self):
+        self.sent = {}
+        self.received = {}
+        self.arrival_order = {}
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self.client = mqtt.Client()
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe(LABEL_TOPIC)
+        self.client.on_subscribe = lambda client, userdata, mid, granted_qos: self._subscribed.set()
+        self.client.on_message = self._on_message
+        self.client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, 60)
+        self.client.loop_start()
+        self._subscribed.wait(10)
+
+    def _on_message(self, client, userdata, msg):
+        data = json.loads(msg.payload)
+        key = (data.get("bearing"), data.get("time"))
+        with self._lock:
+            if key in self.sent and key not in self.received:
+                self.received[key] = time.perf_counter()
+                self.arrival_order.setdefault(key[0], []).append(key[1])
+
+    def publish(self, bearing, sequence, payload):
+        with self._lock:
+            self.sent[(bearing, snapshot_time(sequence))] = time.perf_counter()
+        self.client.publish(SEND_TOPIC, payload)
+
+    def wait_for(self, keys, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if all(key in self.received for key in keys):
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+def wait_until_serving(listener, rng, timeout):
+    # Probe snapshots until one is labelled, so model loading and connection set-up
+    # are not measured
+    deadline = time.monotonic() + timeout
+    sequence = 0
+    while time.monotonic() < deadline:
+        listener.publish("Benchmark_probe", sequence, synthetic_snapshot("Benchmark_probe", sequence, rng))
+        if listener.wait_for([("Benchmark_probe", snapshot_time(sequence))], 2.0):
+            return True
+        sequence += 1
+    return False
+
+def measure(path, payloads, names, interval, startup_timeout=180.0, timeout=120.0, seed=0):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    processes = [subprocess.Popen(command, env=env, start_new_session=True) for command in PATHS[path]]
+    listener = LabelListener()
+    try:
+        if not wait_until_serving(listener, np.random.default_rng(seed), startup_timeout):
+            raise RuntimeError(f"The {path} path did not label a snapshot within {startup_timeout:.0f}s")
+        start = time.perf_counter()
+        for sequence, round_payloads in enumerate(payloads):
+            for name, payload in zip(names, round_payloads):
+                listener.publish(name, sequence, payload)
+            time.sleep(interval)
+        keys = [(name, snapshot_time(sequence)) for sequence in range(len(payloads)) for name in names]
+        listener.wait_for(keys, timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        listener.close()
+        for process in processes:
+            # The whole session, so the worker's feature processes stop too
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
+
+    latencies = np.array([listener.received[key] - listener.sent[key] for key in keys if key in listener.received]) * 1000
+    in_order = all(order == sorted(order) for bearing, order in listener.arrival_order.items() if bearing in names)
+    return {
+        "received": f"{len(latencies)}/{len(keys)}",
+        "in_order": in_order,
+        "labels_per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else None,
+        "max_ms": float(latencies.max()) if len(latencies) else None,
+    }
+
+def run_benchmark(paths=("http", "worker"), bearings=4, snapshots=20, interval=0.5, snapshot_format="json", seed=0):
+    rng = np.random.default_rng(seed)
+    names = [f"Benchmark_{i}" for i in range(bearings)]
+    # Encoded up front so the JSON encoding is not part of the measured latency, and
+    # identical for every path
+    payloads = [[synthetic_snapshot(name, sequence, rng, snapshot_format) for name in names]
+                for sequence in range(snapshots)]
+    results = {path: measure(path, payloads, names, interval, seed=seed) for path in paths}
+
+    print(f"{bearings} bearings, {snapshots} {snapshot_format} snapshots each, a round every {interval}s")
+    print(f"{'path':<8} {'received':>9} {'in order':>9} {'labels/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for path, result in results.items():
+        values = [f"{result[key]:9.1f}" if result[key] is not None else f"{'-':>9}"
+                  for key in ("labels_per_second", "p50_ms", "p95_ms", "max_ms")]
+        print(f"{path:<8} {result['received']:>9} {str(result['in_order']):>9} " + " ".join(values))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare end-to-end MQTT labelling latency of the HTTP path and the worker")
+    parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+    parser.add_argument('--bearings', type=int, default=4)
+    parser.add_argument('--snapshots', type=int, default=20, help="Snapshots per bearing")
+    parser.add_argument('--interval', type=float, default=0.5, help="Seconds between rounds of snapshots")
+    parser.add_argument('--format', choices=["json", "binary"], default="json", help="Snapshot wire format")
+    args = parser.parse_args()
+    run_benchmark(args.paths, args.bearings, args.snapshots, args.interval, args.format)
@@ -0,0 +1,102 @@
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import paho.mqtt.client as mqtt
+
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.config_client import get_config_client
+from bearing_condition_predictor.initialisation import ModelLoader, ModelNotFound, ModelUnavailable, get_project
+from bearing_condition_predictor.single_feat_eng import extract_features
+from bearing_condition_predictor.endpoints import label_snapshot
+from bearing_condition_predictor.snapshot_dispatch import OrderedDispatcher, report_metrics
+from snapshot_format import check_rows, read_header, read_snapshot
+
+# Labels snapshots straight off the broker, without the mqttClient.py -> HTTP -> Flask
+# hop: features are extracted in a process pool and the model loaded by ModelLoader
+# runs in this process. Publishes the same payload as the predict endpoint.
+#   python -m bearing_condition_predictor.mqtt_worker
+
+LISTEN_TOPIC = 'bearing/sendData'
+PUBLISH_TOPIC = 'bearing/label'
+# Redis key the worker metrics are written to every METRICS_INTERVAL seconds
+REDIS_METRICS_KEY = 'mqtt_worker:metrics'
+METRICS_INTERVAL = 10
+
+def extract_snapshot(payload, kl_estimator):
+    # Runs in a feature worker process: decodes the snapshot, binary or JSON, and
+    # extracts its features
+    snapshot = check_rows(read_snapshot(payload))
+    h_freq, v_freq, x_time = extract_features(snapshot.hacc, snapshot.vacc, kl_estimator)
+    return snapshot.directory, snapshot.monitoring_time, h_freq, v_freq, x_time
+
+class InferenceWorker:
+    # Features of every snapshot are extracted in parallel as soon as it arrives, while
+    # labels of a bearing (Directory) are published in the order its snapshots arrived,
+    # as the alerting client expects
+
+    def __init__(self, client, feature_workers, max_in_flight, max_queued):
+        self.client = client
+        # Spawned rather than forked: this process runs TensorFlow
+        self._features = ProcessPoolExecutor(max_workers=feature_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        # A dropped snapshot's extraction is cancelled if it has not started, so the
+        # process pool queue stays bounded too
+        self.dispatcher = OrderedDispatcher(self._label, max_in_flight, max_queued,
+                                            on_drop=lambda future: future.cancel(), thread_name_prefix="inference")
+        self._config_client = get_config_client()
+
+    def submit(self, directory, payload):
+        future = self._features.submit(extract_snapshot, payload, Config.KL_ESTIMATOR)
+        self.dispatcher.submit(directory, future)
+
+    def _label(self, future):
+        directory, monitoring_time, h_freq, v_freq, x_time = future.result()
+        # Routed to the newest version, like mqttClient.py
+        latest = self._config_client.latest_model()
+        if latest is None:
+            raise ValueError("No valid model settings found in Redis")
+        model_name, version = latest
+        try:
+            served_version, model = ModelLoader.resolve(model_name, version)
+        except ModelNotFound:
+            response_data = {"error": "Model not found"}
+        except ModelUnavailable:
+            response_data = {"error": "Model is loading"}
+        else:
+            response_data = label_snapshot(model_name, served_version, model, directory, monitoring_time,
+                                           h_freq, v_freq, x_time)
+        self.client.publish(PUBLISH_TOPIC, json.dumps(response_data))
+        print(f"Published response to topic {PUBLISH_TOPIC}: {response_data}")
+        return "error" not in response_data
+
+def on_connect(client, userdata, flags, rc):
+    print(f"Connected with result code {rc}")
+    client.subscribe(LISTEN_TOPIC)
+    if rc != 0:
+        print(f"Failed to connect, return code {rc}")
+
+def on_message(client, userdata, msg):
+    try:
+        userdata.submit(read_header(msg.payload).get("Directory"), msg.payload)
+    except Exception as e:
+        print(f"Error processing message: {e}")
+        userdata.dispatcher.count_error()
+
+def main():
+    # Pinned model versions are loaded before the first snapshot arrives
+    ModelLoader(get_project())
+    client = mqtt.Client()
+    worker = InferenceWorker(client, Config.INFERENCE_FEATURE_WORKERS, Config.INFERENCE_MAX_IN_FLIGHT,
+                             Config.INFERENCE_MAX_QUEUED_PER_BEARING)
+    threading.Thread(target=report_metrics, daemon=True,
+                     args=(worker.dispatcher, get_config_client().redis_client, REDIS_METRICS_KEY, METRICS_INTERVAL)).start()
+    client.user_data_set(worker)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(Config.MQTT_BROKER, Config.MQTT_PORT, 60)
+    client.loop_forever(retry_first_connection=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import os
+import json
+import numpy as np
+
+# Pure NumPy float32 forward pass for Dense/Concatenate Keras functional models such
+# as NNclassifier.create_model, so the gateway can serve without importing TensorFlow
+
+PARITY_ATOL = 1e-5
+FIXTURE_ROWS = 8
+
+def weights_filename(model_filename):
+    # AE_classifier.pkl -> AE_classifier.npz, stored next to the Keras model
+    return os.path.splitext(model_filename)[0] + ".npz"
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": _relu,
+    "softmax": _softmax,
+}
+
+def export_weights(model, path, seed=0):
+    """Save the layer graph and weights of a Keras functional model to a .npz file.
+
+    A small fixture of random inputs and the Keras outputs for them is stored
+    alongside, and NumpyModel.load checks itself against it.
+    """
+    config = model.get_config()
+    graph = {
+        "inputs": [name for name, _, _ in config["input_layers"]],
+        "outputs": [name for name, _, _ in config["output_layers"]],
+        "layers": [],
+    }
+    arrays = {}
+    for layer_config in config["layers"]:
+        class_name = layer_config["class_name"]
+        name = layer_config["name"]
+        inbound = [node[0] for node in layer_config["inbound_nodes"][0]] if layer_config["inbound_nodes"] else []
+        if class_name == "InputLayer":
+            continue
+        if class_name == "Dense":
+            activation = layer_config["config"]["activation"]
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation} in layer {name}")
+            kernel, bias = model.get_layer(name).get_weights()
+            arrays[name + "/kernel"] = kernel.astype(np.float32)
+            arrays[name + "/bias"] = bias.astype(np.float32)
+            graph["layers"].append({"name": name, "type": "Dense", "inbound": inbound, "activation": activation})
+        elif class_name == "Concatenate":
+            graph["layers"].append({"name": name, "type": "Concatenate", "inbound": inbound})
+        else:
+            raise ValueError(f"Unsupported layer {class_name} ({name})")
+
+    rng = np.random.default_rng(seed)
+    fixture_inputs = [rng.normal(size=(FIXTURE_ROWS,) + tuple(i.shape[1:])).astype(np.float32) for i in model.inputs]
+    arrays["fixture/output"] = model.predict(fixture_inputs, verbose=0).astype(np.float32)
+    for name, x in zip(graph["inputs"], fixture_inputs):
+        arrays["fixture/" + name] = x
+
+    np.savez(path, graph=np.array(json.dumps(graph)), **arrays)
+
+class NumpyModel:
+    def __init__(self, graph, arrays):
+        self.graph = graph
+        self.arrays = arrays
+        self.input_shapes = [arrays["fixture/" + name].shape[1:] for name in graph["inputs"]]
+
+    @classmethod
+    def load(cls, path, check_parity=True):
+        with np.load(path) as data:
+            graph = json.loads(str(data["graph"]))
+            arrays = {key: data[key] for key in data.files if key != "graph"}
+        model = cls(graph, arrays)
+        if check_parity:
+            model.check_parity()
+        return model
+
+    def predict(self, inputs, verbose=0):
+        values = {name: np.asarray(x, dtype=np.float32) for name, x in zip(self.graph["inputs"], inputs)}
+        for layer in self.graph["layers"]:
+            inbound = [values[name] for name in layer["inbound"]]
+            if layer["type"] == "Dense":
+                x = inbound[0] @ self.arrays[layer["name"] + "/kernel"] + self.arrays[layer["name"] + "/bias"]
+                values[layer["name"]] = ACTIVATIONS[layer["activation"]](x)
+            else:
+                values[layer["name"]] = np.concatenate(inbound, axis=-1)
+        return values[self.graph["outputs"][0]]
+
+    def check_parity(self):
+        # Compare against the Keras outputs stored by export_weights
+        fixture_inputs = [self.arrays["fixture/" + name] for name in self.graph["inputs"]]
+        difference = np.abs(self.predict(fixture_inputs) - self.arrays["fixture/output"]).max()
+        if difference > PARITY_ATOL:
+            raise ValueError(f"NumPy engine differs from Keras by {difference} on the stored fixture")
+        return difference
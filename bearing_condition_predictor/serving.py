@@ -0,0 +1,84 @@
+import os
+import tempfile
+import threading
+import numpy as np
+import tensorflow as tf
+
+from bearing_condition_predictor.numpy_engine import NumpyModel, export_weights
+
+SERVING_MODES = ("keras", "function", "tflite", "numpy")
+
+class CompiledModel:
+    # Keras model traced once into a tf.function with a fixed input signature, so
+    # predict skips the data adapter and callback setup of model.predict
+
+    def __init__(self, model):
+        self.keras_model = model
+        input_signature = [tf.TensorSpec(shape=i.shape, dtype=tf.float32, name=i.name) for i in model.inputs]
+        self._forward = tf.function(lambda *inputs: model(list(inputs), training=False),
+                                    input_signature=input_signature)
+        self.input_shapes = [tuple(i.shape[1:]) for i in model.inputs]
+
+    def predict(self, inputs, verbose=0):
+        return self._forward(*[tf.convert_to_tensor(np.asarray(x, dtype=np.float32)) for x in inputs]).numpy()
+
+class TFLiteModel:
+    # Keras model converted to a TFLite flatbuffer at load time
+
+    def __init__(self, model):
+        self.keras_model = model
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        self.interpreter = tf.lite.Interpreter(model_content=converter.convert())
+        self.interpreter.allocate_tensors()
+        self.input_shapes = [tuple(i.shape[1:]) for i in model.inputs]
+
+        # The converter does not keep the Keras input order, so inputs are matched by name
+        details = self.interpreter.get_input_details()
+        self._input_indices = []
+        for i in model.inputs:
+            matches = [d["index"] for d in details if i.name in d["name"]]
+            if len(matches) != 1:
+                raise ValueError(f"Could not match input {i.name} in converted model")
+            self._input_indices.append(matches[0])
+        self._output_index = self.interpreter.get_output_details()[0]["index"]
+        self._batch_size = 1
+        # The interpreter is not thread safe
+        self._lock = threading.Lock()
+
+    def predict(self, inputs, verbose=0):
+        inputs = [np.asarray(x, dtype=np.float32) for x in inputs]
+        with self._lock:
+            batch_size = len(inputs[0])
+            if batch_size != self._batch_size:
+                for index, x in zip(self._input_indices, inputs):
+                    self.interpreter.resize_tensor_input(index, x.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch_size
+            for index, x in zip(self._input_indices, inputs):
+                self.interpreter.set_tensor(index, x)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output_index).copy()
+
+def warm_up(model, input_shapes=None):
+    # Run one dummy batch so tracing/allocation happens at startup rather than on the first request
+    if input_shapes is None:
+        input_shapes = [tuple(i.shape[1:]) for i in model.inputs]
+    model.predict([np.zeros((1,) + shape, dtype=np.float32) for shape in input_shapes], verbose=0)
+
+def compile_for_serving(model, mode="keras"):
+    if mode == "keras":
+        warm_up(model)
+        return model
+    if mode == "function":
+        serving_model = CompiledModel(model)
+    elif mode == "tflite":
+        serving_model = TFLiteModel(model)
+    elif mode == "numpy":
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "weights.npz")
+            export_weights(model, path)
+            serving_model = NumpyModel.load(path)
+    else:
+        raise ValueError(f"Unknown serving mode: {mode}, expected one of {SERVING_MODES}")
+    warm_up(serving_model, serving_model.input_shapes)
+    return serving_model
@@ -0,0 +1,48 @@
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+
+from bearing_condition_predictor.serving import SERVING_MODES, compile_for_serving
+
+# Latency comparison and Keras parity check of the serving modes:
+#   python -m bearing_condition_predictor.serving_benchmark --model bearing_condition_predictor/local_model/bearing_model/1/AE_classifier.pkl
+
+PARITY_ATOL = 1e-5
+
+def random_inputs(model, batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.normal(size=(batch_size,) + tuple(i.shape[1:])).astype(np.float32) for i in model.inputs]
+
+def time_predict(model, inputs, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(inputs, verbose=0)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+def run_benchmark(model, batch_sizes=(1, 8, 32), repeats=100):
+    reference = {batch_size: model.predict(random_inputs(model, batch_size), verbose=0) for batch_size in batch_sizes}
+    for mode in SERVING_MODES:
+        serving_model = compile_for_serving(model, mode)
+        for batch_size in batch_sizes:
+            inputs = random_inputs(model, batch_size)
+            parity = np.abs(serving_model.predict(inputs, verbose=0) - reference[batch_size]).max()
+            latencies = time_predict(serving_model, inputs, repeats)
+            status = "ok" if parity <= PARITY_ATOL else "MISMATCH"
+            print(f"{mode:<9} batch {batch_size:>3}: p50 {np.percentile(latencies, 50):8.3f} ms  "
+                  f"p95 {np.percentile(latencies, 95):8.3f} ms  max |diff| vs keras {parity:.2e} {status}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare serving mode latency and parity against Keras")
+    parser.add_argument('--model', help="Saved classifier to load; an untrained create_model() is used if omitted")
+    parser.add_argument('--repeats', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.model:
+        model = tf.keras.models.load_model(args.model)
+    else:
+        from bearing_model_training_pipeline.NNclassifier import create_model
+        model = create_model()
+    run_benchmark(model, repeats=args.repeats)
@@ -1,12 +1,26 @@
 import numpy as np
 import pandas as pd
 import time
+from functools import lru_cache
 from scipy.fft import rfft, rfftfreq
 from scipy import signal
 from scipy import stats
 from scipy.stats import kurtosis
 from scipy.signal import find_peaks
 
+DECIMATION_FACTOR = 2
+N_FREQUENCY_BINS = 641
+KL_GRID_POINTS = 100
+KL_ESTIMATORS = ("exact", "binned")
+# Sub-grid points per KL grid interval used to bin the data for the binned KDE
+KDE_OVERSAMPLE = 8
+
+FREQUENCY_COLUMNS = ["Hfreq_" + str(i) for i in range(N_FREQUENCY_BINS)] + \
+    ["Vfreq_" + str(i) for i in range(N_FREQUENCY_BINS)]
+TIME_FEATURES = ["zerocross", "kurtosis", "rms", "peaks", "mean", "std", "median",
+                 "skewness", "crest", "energy", "shapiro", "kl", "rkl"]
+TIME_COLUMNS = ["H" + name for name in TIME_FEATURES] + ["V" + name for name in TIME_FEATURES]
+
 def ToFrequency(df):
     headers = []
     for i in range(0, 641):
@@ -27,7 +41,7 @@ def ToFrequency(df):
 
     return df_freq
 
-def ToTime(df):
+def ToTime(df, kl_estimator="exact"):
 
     Hzerocross = []
     Vzerocross = []
@@ -120,33 +134,22 @@ def ToTime(df):
         Vs, Vp = stats.shapiro(Vertical)
         Vshapiro.append(Vs)
 
+        # KDE and reference normal of each channel, evaluated once and shared by KL
+        # and reverse KL
+        x = np.linspace(min(Horizontal), max(Horizontal), KL_GRID_POINTS)
+        Hkde = kde_on_grid(Horizontal, x, kl_estimator)
+        Hnorm = stats.norm.pdf(x, np.mean(Horizontal), np.std(Horizontal))
+        x = np.linspace(min(Vertical), max(Vertical), KL_GRID_POINTS)
+        Vkde = kde_on_grid(Vertical, x, kl_estimator)
+        Vnorm = stats.norm.pdf(x, np.mean(Vertical), np.std(Vertical))
+
         # KL
-        x = np.linspace(min(Horizontal), max(Horizontal), 100)
-        Hen = stats.entropy(
-            stats.gaussian_kde(Horizontal).evaluate(x),
-            stats.norm.pdf(x, np.mean(Horizontal), np.std(Horizontal)),
-        )
-        Hkl.append(Hen)
-        x = np.linspace(min(Vertical), max(Vertical), 100)
-        Ven = stats.entropy(
-            stats.gaussian_kde(Vertical).evaluate(x),
-            stats.norm.pdf(x, np.mean(Vertical), np.std(Vertical)),
-        )
-        Vkl.append(Ven)
+        Hkl.append(stats.entropy(Hkde, Hnorm))
+        Vkl.append(stats.entropy(Vkde, Vnorm))
 
         # Reverse KL
-        x = np.linspace(min(Horizontal), max(Horizontal), 100)
-        Hren = stats.entropy(
-            stats.norm.pdf(x, np.mean(Horizontal), np.std(Horizontal)),
-            stats.gaussian_kde(Horizontal).evaluate(x),
-        )
-        Hrkl.append(Hren)
-        x = np.linspace(min(Vertical), max(Vertical), 100)
-        Vren = stats.entropy(
-            stats.norm.pdf(x, np.mean(Vertical), np.std(Vertical)),
-            stats.gaussian_kde(Vertical).evaluate(x),
-        )
-        Vrkl.append(Vren)
+        Hrkl.append(stats.entropy(Hnorm, Hkde))
+        Vrkl.append(stats.entropy(Vnorm, Vkde))
 
     df = pd.DataFrame(Hzerocross, columns=["Hzerocross"])
     df["Hkurtosis"] = Hkurtosis
@@ -187,4 +190,95 @@ def ToTime(df):
     mask = df["Vrkl"] != np.inf
     df.loc[~mask, "Vrkl"] = df.loc[mask, "Vrkl"].max()
 
-    return df
\ No newline at end of file
+    return df
+
+
+@lru_cache(maxsize=None)
+def decimation_filter(q=DECIMATION_FACTOR):
+    # Same order 8 Chebyshev type I low-pass that signal.decimate designs on
+    # every call for its default ftype='iir'
+    return signal.cheby1(8, 0.05, 0.8 / q, output='sos')
+
+def decimate(x, q=DECIMATION_FACTOR):
+    # Equivalent to signal.decimate(x, q) along the last axis, minus the filter design
+    return signal.sosfiltfilt(decimation_filter(q), x, axis=-1)[..., ::q]
+
+def binned_kde(x, grid):
+    # Gaussian KDE with scipy's Scott bandwidth, evaluated on an evenly spaced grid
+    # spanning [min(x), max(x)] by linear binning onto a finer sub-grid and an FFT
+    # convolution with the sampled kernel, O(n + m log m) instead of O(n * m)
+    n_fine = (len(grid) - 1) * KDE_OVERSAMPLE + 1
+    step = (grid[-1] - grid[0]) / (n_fine - 1)
+    bandwidth = np.std(x, ddof=1) * len(x) ** (-1 / 5)
+
+    position = (x - grid[0]) / step
+    left = np.clip(np.floor(position).astype(int), 0, n_fine - 2)
+    weight = position - left
+    counts = np.bincount(left, 1 - weight, n_fine) + np.bincount(left + 1, weight, n_fine)
+
+    offsets = np.arange(-(n_fine - 1), n_fine) * step
+    kernel = stats.norm.pdf(offsets, 0, bandwidth)
+    density = signal.fftconvolve(counts, kernel, mode='valid') / len(x)
+    return np.maximum(density[::KDE_OVERSAMPLE], 0)
+
+def kde_on_grid(x, grid, kl_estimator="exact"):
+    if kl_estimator == "exact":
+        return stats.gaussian_kde(x).evaluate(grid)
+    if kl_estimator == "binned":
+        return binned_kde(x, grid)
+    raise ValueError(f"Unknown KL estimator: {kl_estimator}, expected one of {KL_ESTIMATORS}")
+
+def distribution_features(x, kl_estimator="exact"):
+    # Shapiro, KL and reverse KL of one decimated channel
+    shapiro, _ = stats.shapiro(x)
+
+    # The KDE and reference normal are evaluated once and shared by KL and reverse KL
+    grid = np.linspace(min(x), max(x), KL_GRID_POINTS)
+    kde = kde_on_grid(x, grid, kl_estimator)
+    norm = stats.norm.pdf(grid, np.mean(x), np.std(x))
+    kl = stats.entropy(kde, norm)
+    rkl = stats.entropy(norm, kde)
+
+    # ToTime replaces an infinite divergence with the max over the remaining rows,
+    # which for a single snapshot is NaN
+    kl = np.nan if kl == np.inf else kl
+    rkl = np.nan if rkl == np.inf else rkl
+
+    return [shapiro, kl, rkl]
+
+def time_features(x, kl_estimator="exact"):
+    # Time domain features of one decimated channel, in TIME_FEATURES order
+    rms = np.sqrt(np.mean(x**2))
+    peaks, _ = find_peaks(x)
+
+    return [
+        ((x[:-1] * x[1:]) < 0).sum() + (x == 0).sum(),
+        kurtosis(x),
+        rms,
+        len(peaks) / len(x),
+        np.mean(x),
+        np.std(x),
+        np.median(abs(x)),
+        stats.skew(x),
+        np.max(np.abs(x)) / rms,
+        np.sum(np.abs(x) ** 2),
+    ] + distribution_features(x, kl_estimator)
+
+def extract_features(hacc, vacc, kl_estimator="exact"):
+    """Single pass equivalent of ToFrequency followed by ToTime for one snapshot.
+
+    Takes the raw Hacc and Vacc arrays and returns the (641,), (641,) and (26,)
+    float32 vectors in the order the classifier expects its horizontal,
+    vertical and meta_input inputs. kl_estimator="binned" swaps the exact
+    scipy KDE behind the KL features for the faster binned_kde.
+    """
+    horizontal = decimate(np.asarray(hacc, dtype=float))
+    vertical = decimate(np.asarray(vacc, dtype=float))
+
+    h_freq = np.abs(rfft(horizontal)).astype(np.float32)
+    v_freq = np.abs(rfft(vertical)).astype(np.float32)
+    x_time = np.array(
+        time_features(horizontal, kl_estimator) + time_features(vertical, kl_estimator), dtype=np.float32
+    )
+
+    return h_freq, v_freq, x_time
@@ -0,0 +1,111 @@
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Dispatch of snapshots arriving on bearing/sendData, shared by the MQTT bridge
+# (mqttClient.py) and the in-process inference worker (mqtt_worker.py)
+
+class OrderedDispatcher:
+    # Runs handler(item) on a pool of max_in_flight threads. Items with the same key (a
+    # bearing's Directory) run one at a time in the order they were submitted, so a
+    # bearing's predictions are published in order while a slow one does not hold up
+    # the other bearings. Each key queues at most max_queued items; beyond that the
+    # oldest is dropped and passed to on_drop.
+
+    METRICS_WINDOW = 1000
+
+    def __init__(self, handler, max_in_flight, max_queued, on_drop=None, thread_name_prefix="dispatch"):
+        self.handler = handler
+        self.max_queued = max_queued
+        self.on_drop = on_drop
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._active = set()
+        self.timings = {"latency": deque(maxlen=self.METRICS_WINDOW)}
+        self.processed = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def submit(self, key, item):
+        # Called on the network thread; never blocks on the handler
+        dropped = None
+        with self._lock:
+            pending = self._queues.setdefault(key, deque())
+            if len(pending) >= self.max_queued:
+                dropped = pending.popleft()[0]
+                self.dropped += 1
+            pending.append((item, time.monotonic()))
+            start = key not in self._active
+            self._active.add(key)
+        if dropped is not None:
+            print(f"Dropped the oldest queued snapshot of {key}")
+            if self.on_drop is not None:
+                self.on_drop(dropped)
+        if start:
+            self._executor.submit(self._run_next, key)
+
+    def _run_next(self, key):
+        with self._lock:
+            item, received_at = self._queues[key].popleft()
+        try:
+            ok = self.handler(item)
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            self.count_error()
+        else:
+            with self._lock:
+                self.processed += 1
+                if ok is False:
+                    self.errors += 1
+                # From arrival on the broker to the handled prediction
+                self.timings["latency"].append(time.monotonic() - received_at)
+        finally:
+            # The next item of this key goes back on the pool, behind the other keys'
+            # waiting items
+            with self._lock:
+                if self._queues[key]:
+                    self._executor.submit(self._run_next, key)
+                else:
+                    self._active.discard(key)
+
+    def count_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record(self, name, seconds):
+        # Extra timing window reported as <name>_ms_p50/p95, e.g. the HTTP round trip
+        with self._lock:
+            self.timings.setdefault(name, deque(maxlen=self.METRICS_WINDOW)).append(seconds)
+
+    def metrics(self):
+        with self._lock:
+            queue_depths = {key: len(pending) for key, pending in self._queues.items()}
+            metrics = {
+                "queue_depth": sum(queue_depths.values()),
+                "queue_depth_by_bearing": queue_depths,
+                "in_flight": len(self._active),
+                "processed": self.processed,
+                "errors": self.errors,
+                "dropped": self.dropped,
+            }
+            for name, window in self.timings.items():
+                milliseconds = np.array(window) * 1000
+                metrics[f"{name}_ms_p50"] = float(np.percentile(milliseconds, 50)) if len(milliseconds) else None
+                metrics[f"{name}_ms_p95"] = float(np.percentile(milliseconds, 95)) if len(milliseconds) else None
+                metrics[f"{name}_ms_max"] = float(milliseconds.max()) if len(milliseconds) else None
+            return metrics
+
+def report_metrics(dispatcher, redis_client, redis_key, interval):
+    # Runs on a daemon thread: writes the dispatcher metrics to redis_key every interval seconds
+    while True:
+        time.sleep(interval)
+        try:
+            metrics = dispatcher.metrics()
+            redis_client.set(redis_key, json.dumps(metrics))
+            print(f"Dispatch metrics: {metrics}")
+        except Exception as e:
+            print(f"Failed to report dispatch metrics: {e}")
@@ -2,14 +2,106 @@ import tensorflow as tf
 from tensorflow import keras
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from scipy.fft import rfft, rfftfreq
 from scipy import signal
 import sklearn
 import os
+import copy
+import threading
+import joblib
+
+from bearing_condition_predictor.config import Config
+
+N_STAGES = 3
+CLUSTERING_MODES = ("streaming", "kmeans")
+
+class RunningStatistics:
+    # Count, mean and sum of squared deviations of every score seen so far, merged one
+    # chunk at a time (Chan et al.) so the threshold never needs the full history
 
-class AutoEncoder:
     def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        n, mean = len(values), float(np.mean(values))
+        m2 = float(np.sum((values - mean) ** 2))
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count) if self.count else 0.0
+
+class StreamingStageClusterer:
+    # MiniBatchKMeans updated with partial_fit on each chunk of encodings, so stage
+    # clusters keep their identity across chunks instead of being refitted. Clusters are
+    # ordered into stages by the mean position of their members in the whole stream, the
+    # running version of correct_labels' ordering within a chunk. The state is persisted
+    # to state_path after every uploaded chunk.
+
+    def __init__(self, state_path=None, n_clusters=N_STAGES, seed=0):
+        self.state_path = state_path
+        # No random reassignment of small clusters, which would change their identity
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, reassignment_ratio=0.0, n_init=3)
+        self.position_sums = np.zeros(n_clusters)
+        self.position_counts = np.zeros(n_clusters)
+        self.rows_seen = 0
+        self.scores = RunningStatistics()
+        if state_path and os.path.exists(state_path):
+            self.__dict__.update(joblib.load(state_path))
+
+    def save(self):
+        state = {key: value for key, value in self.__dict__.items() if key != "state_path"}
+        # Written to a temporary file and renamed, since several workers may share the file
+        joblib.dump(state, self.state_path + ".tmp")
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def stage_order(self):
+        # stage_order()[cluster] is the stage of that cluster; clusters with no members yet sort last
+        means = np.divide(self.position_sums, self.position_counts,
+                          out=np.full(len(self.position_sums), np.inf), where=self.position_counts > 0)
+        order = np.empty(len(means), dtype=int)
+        order[np.argsort(means, kind="stable")] = np.arange(len(means))
+        return order
+
+    def update(self, encoding, chunk_rows):
+        # encoding holds the first rows of a chunk of chunk_rows rows
+        if len(encoding) >= self.kmeans.n_clusters:
+            self.kmeans.partial_fit(encoding)
+        clusters = self.kmeans.predict(encoding)
+        positions = self.rows_seen + np.arange(len(encoding))
+        n_clusters = len(self.position_sums)
+        self.position_sums += np.bincount(clusters, weights=positions, minlength=n_clusters)
+        self.position_counts += np.bincount(clusters, minlength=n_clusters)
+        self.rows_seen += chunk_rows
+        return self.stage_order()[clusters]
+
+    def anomaly_threshold(self, score):
+        self.scores.update(score)
+        return self.scores.mean + 3 * self.scores.std
+
+class AutoEncoder:
+    # warm_start fine-tunes from the weights of the previous chunk, persisted to
+    # weights_path so they survive worker restarts, and stops once the reconstruction
+    # loss stops improving. With warm_start=False every chunk trains from the initial
+    # weights for max_epochs, as before.
+    #
+    # clustering="streaming" labels stages with a StreamingStageClusterer and an anomaly
+    # threshold from the running score statistics; "kmeans" refits KMeans and recomputes
+    # the threshold on every chunk, as before. A streaming chunk updates a copy of the
+    # clusterer, kept only once commit_labels() is called after the chunk is uploaded,
+    # so a chunk that fails to upload and is labelled again is not counted twice.
+
+    def __init__(self, weights_path=None, warm_start=True, max_epochs=100, fine_tune_epochs=20, patience=5,
+                 clustering="streaming", cluster_state_path=None):
+        if clustering not in CLUSTERING_MODES:
+            raise ValueError(f"Unknown clustering mode: {clustering}, expected one of {CLUSTERING_MODES}")
         # AutoEncoder architecture
         input_freq = keras.Input(shape=(641,))
         encoded = keras.layers.Dense(256, activation="relu")(input_freq)
@@ -29,29 +121,73 @@ class AutoEncoder:
         self.weights = self.autoencoder.get_weights()
         self.autoencoder.compile(optimizer="adam", loss="mae")
 
+        self.weights_path = weights_path
+        self.warm_start = warm_start
+        self.max_epochs = max_epochs
+        self.fine_tune_epochs = fine_tune_epochs
+        self.patience = patience
+        self.trained = False
+        self.epochs_run = []
+        if warm_start and weights_path and os.path.exists(weights_path):
+            self.load_weights(weights_path)
+        self.clustering = clustering
+        self.clusterer = StreamingStageClusterer(cluster_state_path) if clustering == "streaming" else None
+        self.pending_clusterer = None
+
+    def load_weights(self, path):
+        with np.load(path) as data:
+            self.autoencoder.set_weights([data[f"arr_{i}"] for i in range(len(data.files))])
+        self.trained = True
+
+    def save_weights(self, path):
+        # Written to a temporary file and renamed, since several workers may share the file
+        with open(path + ".tmp", 'wb') as file:
+            np.savez(file, *self.autoencoder.get_weights())
+        os.replace(path + ".tmp", path)
+
     def fit_autoencoder(self, Xt):
-        self.autoencoder.set_weights(self.weights)
-        self.autoencoder.fit(
-            Xt[:, :641], Xt[:, :641], epochs=100, batch_size=64, shuffle=True, verbose=False
+        if self.warm_start and self.trained:
+            epochs = self.fine_tune_epochs
+        else:
+            self.autoencoder.set_weights(self.weights)
+            epochs = self.max_epochs
+        callbacks = []
+        if self.warm_start:
+            callbacks.append(keras.callbacks.EarlyStopping(
+                monitor="loss", patience=self.patience, restore_best_weights=True
+            ))
+        history = self.autoencoder.fit(
+            Xt[:, :641], Xt[:, :641], epochs=epochs, batch_size=64, shuffle=True, verbose=False, callbacks=callbacks
         )
+        self.epochs_run.append(len(history.history["loss"]))
+        self.trained = True
+        if self.warm_start and self.weights_path:
+            self.save_weights(self.weights_path)
 
     def encode_data(self, Xt):
-        return self.encoder.predict(Xt)
+        return self.encoder.predict_on_batch(Xt)
 
     def get_anomaly_labels(self, Xt, Xf):
-        self.autoencoder.set_weights(self.weights)
-        self.autoencoder.fit(
-            Xt[:, :641], Xt[:, :641], epochs=100, batch_size=64, shuffle=True, verbose=False
-        )
+        self.fit_autoencoder(Xt)
 
-        Hencoded_f = self.encoder.predict(Xt[:, :641])
-        Hdecoded_f = self.autoencoder.predict(Xf[:, :641])
+        # A chunk fits in one batch, so predict_on_batch skips the data adapter setup of predict
+        Hencoded_f = self.encoder.predict_on_batch(Xt[:, :641])
+        Hdecoded_f = self.autoencoder.predict_on_batch(Xf[:, :641])
         score = np.abs(Xf[:, :641] - Hdecoded_f).mean(axis=1)
-        anomaly_threshold = np.mean(score) + 3 * np.std(score)
 
-        Vencoded_f = self.encoder.predict(Xt[:, 641:])
+        Vencoded_f = self.encoder.predict_on_batch(Xt[:, 641:])
         Encoding = np.concatenate((Hencoded_f, Vencoded_f), axis=1)
 
+        if self.clustering == "streaming":
+            clusterer = copy.deepcopy(self.clusterer)
+            stages = clusterer.update(Encoding, len(Xf))
+            anomaly_threshold = clusterer.anomaly_threshold(score)
+            self.pending_clusterer = clusterer
+            labels = np.where(score > anomaly_threshold, 3, 2)
+            labels[:len(stages)] = stages
+            return labels
+
+        anomaly_threshold = np.mean(score) + 3 * np.std(score)
         kmeans = KMeans(n_clusters=3, random_state=0).fit(Encoding)
         kMeanslabels = kmeans.labels_
 
@@ -60,16 +196,42 @@ class AutoEncoder:
 
         return final_labels
 
+    def commit_labels(self):
+        # Keeps, and persists, the clusterer state of the last labelled chunk
+        if self.pending_clusterer is None:
+            return
+        self.clusterer, self.pending_clusterer = self.pending_clusterer, None
+        if self.clusterer.state_path:
+            self.clusterer.save()
+
     def correct_labels(self, Hl, Al):
-        labelsb = Al
-        labelsb = np.where(labelsb == 1, 3, 2)
-        avg = []
-        for i in range(3):
-            avg.append(np.sum(np.where(Hl == i)) / len(np.where(Hl == i)[0]))
-        new = np.copy(Hl)
-        for i in range(3):
-            idx = np.argmin(avg)
-            new[np.where(Hl == idx)] = i
-            avg[idx] = float("inf")
-        labelsb[: Hl.shape[0]] = new
-        return labelsb
\ No newline at end of file
+        # Clusters are renumbered 0..2 by the mean row position of their members, and the
+        # rows after Hl are labelled 3 if anomalous and 2 otherwise
+        labelsb = np.where(Al == 1, 3, 2)
+        counts = np.bincount(Hl, minlength=N_STAGES)
+        sums = np.bincount(Hl, weights=np.arange(len(Hl)), minlength=N_STAGES)
+        avg = np.divide(sums, counts, out=np.full(N_STAGES, np.inf), where=counts > 0)
+        order = np.empty(N_STAGES, dtype=Hl.dtype)
+        order[np.argsort(avg, kind="stable")] = np.arange(N_STAGES)
+        labelsb[: Hl.shape[0]] = order[Hl]
+        return labelsb
+
+_autoencoder = None
+_autoencoder_lock = threading.Lock()
+
+def get_autoencoder():
+    # One AutoEncoder per worker process, so the model graph is built once and the
+    # weights carry over from chunk to chunk
+    global _autoencoder
+    with _autoencoder_lock:
+        if _autoencoder is None:
+            _autoencoder = AutoEncoder(
+                weights_path=Config.AUTOENCODER_WEIGHTS,
+                warm_start=Config.AUTOENCODER_WARM_START,
+                max_epochs=Config.AUTOENCODER_MAX_EPOCHS,
+                fine_tune_epochs=Config.AUTOENCODER_FINE_TUNE_EPOCHS,
+                patience=Config.AUTOENCODER_PATIENCE,
+                clustering=Config.AUTOENCODER_CLUSTERING,
+                cluster_state_path=Config.AUTOENCODER_CLUSTER_STATE,
+            )
+        return _autoencoder
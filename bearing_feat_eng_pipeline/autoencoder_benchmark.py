@@ -0,0 +1,75 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+import numpy as np
+from tensorflow import keras
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bearing_feat_eng_pipeline.AutoEncoder import AutoEncoder
+
+# Labelling cost and label agreement of the warm-started AutoEncoder against training
+# from scratch on every chunk, over consecutive chunks as the feature pipeline sees them:
+#   python -m bearing_feat_eng_pipeline.autoencoder_benchmark --features Bearing1_1.npz
+# where the .npz is written by bearing_condition_predictor.batch_feat_eng.
+
+CHUNK_SIZE = 50
+
+def synthetic_features(n_rows, seed=0):
+    # Spectra of a run that degrades over time: broadband noise rising in level, plus a
+    # fault tone that appears half way and grows
+    rng = np.random.default_rng(seed)
+    progress = np.linspace(0, 1, n_rows)[:, None]
+    bins = np.arange(641)
+    noise = rng.gamma(2.0, 1.0, size=(n_rows, 1282)) * (1 + 2 * progress ** 2)
+    tone = np.exp(-0.5 * ((bins - 160) / 3.0) ** 2) * 40 * np.clip(progress - 0.5, 0, None)
+    noise[:, :641] += tone
+    noise[:, 641:] += tone
+    return noise.astype(np.float32)
+
+def chunk_labels(autoencoder, df_freq):
+    # Same 80/20 split as FeatureEngineeringPipeline.generate_labels
+    n_rows = int(0.8 * len(df_freq))
+    start = time.perf_counter()
+    labels = autoencoder.get_anomaly_labels(df_freq[:n_rows], df_freq)
+    # As the pipeline does once the chunk is uploaded
+    autoencoder.commit_labels()
+    return labels, time.perf_counter() - start
+
+def run_benchmark(features, chunk_size=CHUNK_SIZE, seed=0):
+    with tempfile.TemporaryDirectory() as directory:
+        keras.utils.set_random_seed(seed)
+        cold = AutoEncoder(warm_start=False, clustering="kmeans")
+        keras.utils.set_random_seed(seed)
+        warm = AutoEncoder(weights_path=os.path.join(directory, "autoencoder_weights.npz"),
+                           cluster_state_path=os.path.join(directory, "autoencoder_clusters.pkl"))
+
+        cold_seconds, warm_seconds, agreement = [], [], []
+        for chunk, start in enumerate(range(0, len(features) - chunk_size + 1, chunk_size)):
+            df_freq = features[start:start + chunk_size]
+            cold_labels, cold_time = chunk_labels(cold, df_freq)
+            warm_labels, warm_time = chunk_labels(warm, df_freq)
+            cold_seconds.append(cold_time)
+            warm_seconds.append(warm_time)
+            agreement.append(np.mean(cold_labels == warm_labels))
+            print(f"chunk {chunk:>3}: scratch {cold_time:7.2f}s  warm {warm_time:7.2f}s "
+                  f"({warm.epochs_run[-1]:>3} epochs)  label agreement {agreement[-1]:.2f}")
+
+    print(f"total: scratch {sum(cold_seconds):.1f}s  warm {sum(warm_seconds):.1f}s  "
+          f"speedup {sum(cold_seconds) / sum(warm_seconds):.1f}x  mean agreement {np.mean(agreement):.3f}")
+    return cold_seconds, warm_seconds, agreement
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare warm-started, streaming and from-scratch AutoEncoder labelling")
+    parser.add_argument('--features', help=".npz with horizontal/vertical arrays; a synthetic run is used if omitted")
+    parser.add_argument('--chunks', type=int, default=10, help="Number of consecutive chunks to label")
+    args = parser.parse_args()
+
+    if args.features:
+        with np.load(args.features) as data:
+            features = np.concatenate((data["horizontal"], data["vertical"]), axis=1)
+    else:
+        features = synthetic_features(args.chunks * CHUNK_SIZE)
+    run_benchmark(features[:args.chunks * CHUNK_SIZE])
@@ -1,15 +1,22 @@
 import sys
 import os
+import io
+import json
 import pandas as pd
 import numpy as np
 from time import sleep
+from concurrent.futures import ThreadPoolExecutor, wait
 import redis
+import requests
 
 # Add the parent directory to the system path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bearing_condition_predictor import feature_groups_loader
-from bearing_feat_eng_pipeline.AutoEncoder import AutoEncoder
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.initialisation import get_feature_groups_loader
+from bearing_condition_predictor.feature_log import get_feature_log
+from bearing_condition_predictor.single_feat_eng import FREQUENCY_COLUMNS, TIME_COLUMNS
+from bearing_feat_eng_pipeline.AutoEncoder import get_autoencoder
 
 # Helper functions to read and write the last position
 def read_last_position(redis_client, redis_key):
@@ -19,21 +26,132 @@ def read_last_position(redis_client, redis_key):
 def write_last_position(redis_client, redis_key, position):
     redis_client.set(redis_key, position)
 
+# The CSV cursor is the byte offset of the next unread row plus the number of rows read.
+# An older cursor holding only the row count has no offset and is resolved on first read.
+def read_csv_cursor(redis_client, redis_key):
+    cursor = redis_client.get(redis_key)
+    if not cursor:
+        return 0, 0
+    cursor = json.loads(cursor)
+    if isinstance(cursor, int):
+        return None, cursor
+    return cursor["offset"], cursor["records"]
+
+def write_csv_cursor(redis_client, redis_key, offset, records):
+    redis_client.set(redis_key, json.dumps({"offset": offset, "records": records}))
+
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+def is_transient(error):
+    # Connection drops and timeouts, and REST errors (hsfs RestAPIError, requests
+    # HTTPError) whose response is a 429 or 5xx; schema and validation errors are not
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+def insert_with_retry(feature_group, df, retries, backoff):
+    # Transient insert errors are retried with exponential backoff, any other error is
+    # raised straight away; rows are keyed by 'index', so a retried insert upserts
+    # rather than duplicates
+    for attempt in range(retries + 1):
+        try:
+            return feature_group.insert(df, wait=True, overwrite=False)
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"Insert into {feature_group.name} failed ({e}), retrying in {delay}s")
+            sleep(delay)
+
+def insert_all(feature_groups, dfs, max_workers, retries, backoff):
+    # Inserts every (feature group, frame) pair concurrently and waits for all of them;
+    # raises the first failure only after the other inserts have finished
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(insert_with_retry, feature_group, df, retries, backoff)
+                   for feature_group, df in zip(feature_groups, dfs)]
+        wait(futures)
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise errors[0]
+
 class FeatureEngineeringPipeline:
     def __init__(self, csv_file_path, position_file):
         self.csv_file_path = csv_file_path
         self.redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
-        self.REDIS_LAST_READ_KEY = 'db:last_read'
-        self.last_position = read_last_position(self.redis_client, self.REDIS_LAST_READ_KEY)
-        self.fg_frequency_0, self.fg_frequency_1, self.fg_frequency_2, self.fg_frequency_3, self.fg_time_domain = feature_groups_loader.get_feature_groups()
+        self.REDIS_LAST_READ_KEY = 'db:last_read' if Config.FEATURE_LOG_FORMAT == "csv" else 'db:feature_log:last_read'
+        if Config.FEATURE_LOG_FORMAT == "csv":
+            self.last_offset, self.last_position = read_csv_cursor(self.redis_client, self.REDIS_LAST_READ_KEY)
+        else:
+            self.last_position = read_last_position(self.redis_client, self.REDIS_LAST_READ_KEY)
+        self.feature_groups_loader = get_feature_groups_loader()
+        self.fg_frequency_0, self.fg_frequency_1, self.fg_frequency_2, self.fg_frequency_3, self.fg_time_domain = self.feature_groups_loader.get_feature_groups()
         self.column_names = ['bearing_number', 'timestamp', 'df_freq', 'df_time']
-        self.feature_extractor = AutoEncoder()
+        self.feature_extractor = get_autoencoder()
 
     def read_in_chunks(self, chunk_size=50):
-        df = pd.read_csv(self.csv_file_path, skiprows=range(1, self.last_position + 1), nrows=chunk_size, names=self.column_names)
-        self.last_position += len(df)
+        # Seeks straight to the cursor and reads at most chunk_size complete rows, so
+        # the cost of a run does not grow with the size of the file
+        lines = []
+        with open(self.csv_file_path, 'rb') as file:
+            if self.last_offset is None:
+                # Older row count cursor: skip the header and rows once to find the offset
+                for _ in range(self.last_position + 1):
+                    file.readline()
+                self.last_offset = file.tell()
+            elif self.last_offset == 0:
+                header = file.readline()
+                if not header.endswith(b'\n'):
+                    return pd.DataFrame(columns=self.column_names)
+                self.last_offset = len(header)
+            else:
+                file.seek(self.last_offset)
+
+            while len(lines) < chunk_size:
+                line = file.readline()
+                # Stop at EOF or at a row whose write has not been fully flushed yet
+                if not line.endswith(b'\n'):
+                    break
+                lines.append(line)
+
+        self.last_offset += sum(len(line) for line in lines)
+        self.last_position += len(lines)
+        print(self.last_position)
+        if not lines:
+            return pd.DataFrame(columns=self.column_names)
+        return pd.read_csv(io.BytesIO(b''.join(lines)), header=None, names=self.column_names)
+
+    def parse_csv_chunk(self, df_chunk):
+        # Initialize lists to store data from all rows in the chunk
+        df_freq_list = []
+        df_time_list = []
+        
+        for index, row in df_chunk.iterrows():
+            json_df_freq = row['df_freq']
+            json_df_time = row['df_time']
+            bearing_number = row['bearing_number']
+            time_str = row['timestamp']
+
+            df_freq = pd.read_json(io.StringIO(json_df_freq))
+            df_time = pd.read_json(io.StringIO(json_df_time))
+            
+             # Append to lists
+            df_freq_list.append(df_freq)
+            df_time_list.append(df_time)
+        
+        # Concatenate all rows into single DataFrames
+        df_freq_all = pd.concat(df_freq_list, ignore_index=True)
+        df_time_all = pd.concat(df_time_list, ignore_index=True)
+        return df_freq_all, df_time_all
+
+    def read_log_chunk(self, chunk_size=50):
+        # Records come back as views of the memory mapped segment, no parsing involved
+        records = get_feature_log().read(self.last_position, chunk_size)
+        self.last_position += len(records)
         print(self.last_position)
-        return df
+        df_freq = pd.DataFrame(records["frequency"], columns=FREQUENCY_COLUMNS)
+        df_time = pd.DataFrame(records["time_domain"], columns=TIME_COLUMNS)
+        return df_freq, df_time
 
     def generate_labels(self, df_freq):
         n_rows = int(0.8 * len(df_freq))
@@ -42,8 +160,8 @@ class FeatureEngineeringPipeline:
         
         return self.feature_extractor.get_anomaly_labels(Xt, Xf)
     
-    def upload_features(self, df_freq, df_time, labels):
-        current_index_value = feature_groups_loader.get_current_index_value()
+    def upload_features(self, df_freq, df_time, labels, reservation=None):
+        current_index_value = self.feature_groups_loader.reserve_index_range(len(df_freq), reservation)
         new_index_values = range(current_index_value, current_index_value + len(df_freq))
         
         frequency_df_0 = df_freq.iloc[:, :321].copy()
@@ -64,55 +182,51 @@ class FeatureEngineeringPipeline:
         print(df_time_domain)
         print(frequency_df_3)
         
-        self.fg_frequency_0.insert(frequency_df_0, wait=True, overwrite=False)
-        sleep(10)
-        self.fg_frequency_1.insert(frequency_df_1, wait=True, overwrite=False)
-        sleep(10)
-        self.fg_frequency_2.insert(frequency_df_2, wait=True, overwrite=False)
-        sleep(10)
-        self.fg_frequency_3.insert(frequency_df_3, wait=True, overwrite=False)
-        sleep(10)
-        self.fg_time_domain.insert(df_time_domain, wait=True, overwrite=False)
-        sleep(5)
-        
-        # Increment the current index value
-        feature_groups_loader.increment_index_value(len(df_freq))
+        insert_all(
+            [self.fg_frequency_0, self.fg_frequency_1, self.fg_frequency_2, self.fg_frequency_3, self.fg_time_domain],
+            [frequency_df_0, frequency_df_1, frequency_df_2, frequency_df_3, df_time_domain],
+            Config.UPLOAD_WORKERS, Config.UPLOAD_RETRIES, Config.UPLOAD_BACKOFF
+        )
     
     def run(self):
-        df_chunk = self.read_in_chunks()
-        if df_chunk.empty or len(df_chunk) < 50:
-            print("Not enough data to process")
-            return
-        
-        # Initialize lists to store data from all rows in the chunk
-        df_freq_list = []
-        df_time_list = []
-        
-        for index, row in df_chunk.iterrows():
-            json_df_freq = row['df_freq']
-            json_df_time = row['df_time']
-            bearing_number = row['bearing_number']
-            time_str = row['timestamp']
-
-            df_freq = pd.read_json(json_df_freq)
-            df_time = pd.read_json(json_df_time)
-            
-             # Append to lists
-            df_freq_list.append(df_freq)
-            df_time_list.append(df_time)
-        
-        # Concatenate all rows into single DataFrames
-        df_freq_all = pd.concat(df_freq_list, ignore_index=True)
-        df_time_all = pd.concat(df_time_list, ignore_index=True)
+        # The chunk's starting cursor names its index reservation, so a chunk whose
+        # upload was interrupted is re-uploaded next run with the same index range
+        reservation = f"{self.REDIS_LAST_READ_KEY}:{self.last_position}"
+        if Config.FEATURE_LOG_FORMAT == "csv":
+            df_chunk = self.read_in_chunks()
+            if df_chunk.empty or len(df_chunk) < 50:
+                print("Not enough data to process")
+                return
+            df_freq_all, df_time_all = self.parse_csv_chunk(df_chunk)
+        else:
+            df_freq_all, df_time_all = self.read_log_chunk()
+            if len(df_freq_all) < 50:
+                print("Not enough data to process")
+                return
         
         labels = self.generate_labels(df_freq_all)
         print(labels)
-        self.upload_features(df_freq_all, df_time_all, labels)
+        try:
+            self.upload_features(df_freq_all, df_time_all, labels, reservation)
+        except Exception:
+            # Every insert has finished by now. A range held by a failed upload would stop
+            # the training cache at lowest_pending_index for good, so it is released; the
+            # retried chunk gets a new range, and the rows that did get inserted under the
+            # old one are in only some of the groups, so they never join into the
+            # training data
+            self.feature_groups_loader.release_reservation(reservation)
+            raise
+        # The chunk's labels are stored, so the clusterer state they came from is kept
+        self.feature_extractor.commit_labels()
         
         # Update the last read position
-        write_last_position(self.redis_client, self.REDIS_LAST_READ_KEY, self.last_position)
-        
-        sleep(5)
+        if Config.FEATURE_LOG_FORMAT == "csv":
+            write_csv_cursor(self.redis_client, self.REDIS_LAST_READ_KEY, self.last_offset, self.last_position)
+        else:
+            write_last_position(self.redis_client, self.REDIS_LAST_READ_KEY, self.last_position)
+            # Sealed segments that have been fully uploaded are no longer needed
+            get_feature_log().compact(self.last_position)
+        self.feature_groups_loader.release_reservation(reservation)
 
 #if __name__ == '__main__':
 #    pipeline = FeatureEngineeringPipeline('bearing_predictions.csv', 'last_position.txt')
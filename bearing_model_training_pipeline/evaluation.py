@@ -0,0 +1,126 @@
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from bearing_model_training_pipeline.training_cache import TrainingCache
+
+# Champion/challenger gate run by ModelPromoter before a new version is published: both
+# models are scored on the same held-out cache rows, accuracy in a process per model and
+# latency in one process afterwards, and the challenger is promoted only if it passes
+# the thresholds in check_promotion.
+
+N_CLASSES = 4
+
+def load_rows(cache_args, rows):
+    # Model inputs and labels of the held-out rows, from the cache memory maps
+    arrays = TrainingCache(*cache_args).arrays()
+    data = [arrays["horizontal"][rows], arrays["vertical"][rows], arrays["meta_input"][rows]]
+    return data, arrays["labels"][rows]
+
+def score_model(model_path, cache_args, rows, batch_size=512):
+    """Accuracy and per-class accuracy of a saved model.
+
+    Runs in a worker process, so the model is loaded from model_path and the rows
+    are read from the cache memory maps rather than passed in.
+    """
+    # TensorFlow is imported in the worker only
+    import tensorflow as tf
+
+    data, labels = load_rows(cache_args, rows)
+    model = tf.keras.models.load_model(model_path)
+    predicted = np.argmax(model.predict(data, batch_size=batch_size, verbose=0), axis=1)
+
+    per_class = {}
+    for label in range(N_CLASSES):
+        members = labels == label
+        # None when the held-out rows have no example of the class
+        per_class[str(label)] = float(np.mean(predicted[members] == label)) if members.any() else None
+
+    return {
+        "rows": int(len(rows)),
+        "accuracy": float(np.mean(predicted == labels)),
+        "class_accuracy": per_class,
+    }
+
+def measure_latencies(model_paths, cache_args, rows, serving_mode="keras", latency_rows=200):
+    """Single-row inference latency of each saved model, as the gateway sees it.
+
+    Runs in one worker process with nothing else scoring, and times the models one
+    call at a time, alternating row by row, so they never contend with each other and
+    drift in machine load affects them alike.
+    """
+    import tensorflow as tf
+    from bearing_condition_predictor.serving import compile_for_serving
+
+    data, _ = load_rows(cache_args, rows)
+    serving_models = {name: compile_for_serving(tf.keras.models.load_model(path), serving_mode)
+                      for name, path in model_paths.items()}
+    latencies = {name: [] for name in serving_models}
+    for row in range(min(latency_rows, len(rows))):
+        inputs = [x[row:row + 1] for x in data]
+        for name, serving_model in serving_models.items():
+            start = time.perf_counter()
+            serving_model.predict(inputs, verbose=0)
+            latencies[name].append(time.perf_counter() - start)
+
+    results = {}
+    for name, seconds in latencies.items():
+        milliseconds = np.array(seconds) * 1000
+        results[name] = {
+            "latency_p50_ms": float(np.percentile(milliseconds, 50)) if len(milliseconds) else None,
+            "latency_p95_ms": float(np.percentile(milliseconds, 95)) if len(milliseconds) else None,
+        }
+    return results
+
+def score_models(model_paths, cache_args, rows, max_workers=2, serving_mode="keras", latency_rows=200,
+                 batch_size=512):
+    # Models are scored in spawned processes: TensorFlow is not fork safe, and the
+    # training worker's own graph and memory are left alone. Accuracy is computed in
+    # parallel; latency only once that is done, in a single process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = {name: executor.submit(score_model, path, cache_args, rows, batch_size)
+                   for name, path in model_paths.items()}
+        scores = {name: future.result() for name, future in futures.items()}
+        latencies = executor.submit(measure_latencies, model_paths, cache_args, rows, serving_mode,
+                                    latency_rows).result()
+    for name, latency in latencies.items():
+        scores[name].update(latency)
+    return scores
+
+def check_promotion(challenger, champion=None, min_accuracy=0.0, max_accuracy_drop=0.0,
+                    max_class_accuracy_drop=0.1, max_latency_ratio=1.5):
+    # Returns the reasons the challenger fails; an empty list means it can be promoted
+    failures = []
+    if challenger["accuracy"] < min_accuracy:
+        failures.append(f"accuracy {challenger['accuracy']:.3f} below {min_accuracy:.3f}")
+    if champion is None:
+        return failures
+
+    if challenger["accuracy"] < champion["accuracy"] - max_accuracy_drop:
+        failures.append(f"accuracy {challenger['accuracy']:.3f} vs champion {champion['accuracy']:.3f}")
+    for label, accuracy in challenger["class_accuracy"].items():
+        champion_accuracy = champion["class_accuracy"].get(label)
+        if accuracy is not None and champion_accuracy is not None and accuracy < champion_accuracy - max_class_accuracy_drop:
+            failures.append(f"class {label} accuracy {accuracy:.3f} vs champion {champion_accuracy:.3f}")
+    if challenger["latency_p50_ms"] and champion["latency_p50_ms"] and \
+            challenger["latency_p50_ms"] > champion["latency_p50_ms"] * max_latency_ratio:
+        failures.append(f"p50 latency {challenger['latency_p50_ms']:.2f} ms vs champion {champion['latency_p50_ms']:.2f} ms")
+    return failures
+
+def report_metrics(report):
+    # Flattens an evaluation report into the numeric metrics the model registry accepts
+    metrics = {"promoted": float(report["promoted"])}
+    for name in ("challenger", "champion"):
+        scores = report.get(name)
+        if scores is None:
+            continue
+        metrics[f"{name}_accuracy"] = scores["accuracy"]
+        for label, accuracy in scores["class_accuracy"].items():
+            if accuracy is not None:
+                metrics[f"{name}_class_{label}_accuracy"] = accuracy
+        for key in ("latency_p50_ms", "latency_p95_ms"):
+            if scores[key] is not None:
+                metrics[f"{name}_{key}"] = scores[key]
+    return metrics
@@ -0,0 +1,126 @@
+import os
+import json
+import numpy as np
+
+# Local copy of a feature view's rows as float32 matrices in the classifier's input
+# layout, so a retrain only fetches rows added since the last one:
+#
+#   training_cache/<feature_view>_<version>/
+#       horizontal.bin  (rows, 641) float32
+#       vertical.bin    (rows, 641) float32
+#       meta_input.bin  (rows, 26) float32
+#       labels.bin      (rows,) int64
+#       index.bin       (rows,) int64
+#       state.json      {"rows": ..., "high_water_mark": ...}
+#
+# Rows are appended in 'index' order and state.json, replaced atomically after the
+# arrays are written, is the only record of how many rows are valid.
+
+ARRAYS = {
+    "horizontal": (np.float32, (641,)),
+    "vertical": (np.float32, (641,)),
+    "meta_input": (np.float32, (26,)),
+    "labels": (np.int64, ()),
+    "index": (np.int64, ()),
+}
+
+class TrainingCache:
+    def __init__(self, base_dir, feature_view_name, feature_view_version):
+        self.directory = os.path.join(base_dir, f"{feature_view_name}_{feature_view_version}")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".bin")
+
+    def _read_state(self):
+        path = os.path.join(self.directory, "state.json")
+        if not os.path.exists(path):
+            return {"rows": 0, "high_water_mark": None}
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def _write_state(self, state):
+        path = os.path.join(self.directory, "state.json")
+        with open(path + ".tmp", 'w') as file:
+            json.dump(state, file)
+        os.replace(path + ".tmp", path)
+
+    @property
+    def rows(self):
+        return self._read_state()["rows"]
+
+    @property
+    def high_water_mark(self):
+        return self._read_state()["high_water_mark"]
+
+    def append(self, df):
+        """Append the rows of a feature view read, as returned by query.read().
+
+        Columns are taken by position after dropping 'index' and 'labels', the same
+        layout ModelTrainer.prepare_data slices.
+        """
+        if len(df) == 0:
+            return 0
+        df = df.sort_values("index")
+        features = df.drop(columns=["index", "labels"])
+        arrays = {
+            "horizontal": features.iloc[:, :641].to_numpy(np.float32),
+            "vertical": features.iloc[:, 641:1282].to_numpy(np.float32),
+            "meta_input": features.iloc[:, -26:].to_numpy(np.float32),
+            "labels": df["labels"].to_numpy(np.int64),
+            "index": df["index"].to_numpy(np.int64),
+        }
+        state = self._read_state()
+        for name, (dtype, shape) in ARRAYS.items():
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+            with open(self._path(name), 'ab') as file:
+                # Drop rows written by an append that never reached state.json
+                file.truncate(state["rows"] * row_bytes)
+                file.write(np.ascontiguousarray(arrays[name]).tobytes())
+        self._write_state({"rows": state["rows"] + len(df), "high_water_mark": int(arrays["index"][-1])})
+        return len(df)
+
+    def update(self, query, index_feature, pending_index=None, read_options=None):
+        """Fetch and append the rows of query whose index is above the high-water mark.
+
+        index_feature is the 'index' feature of one of the joined groups, used to build
+        the filter. Rows at or above pending_index, the start of the lowest index range
+        still being uploaded, are left for a later update so the gap is not skipped.
+        """
+        high_water_mark = self.high_water_mark
+        if high_water_mark is not None:
+            query = query.filter(index_feature > high_water_mark)
+        if pending_index is not None:
+            query = query.filter(index_feature < pending_index)
+        return self.append(query.read(read_options=read_options))
+
+    def arrays(self):
+        # Read-only memory maps of the valid rows; nothing is loaded until indexed
+        rows = self.rows
+        if rows == 0:
+            return {name: np.empty((0,) + shape, dtype=dtype) for name, (dtype, shape) in ARRAYS.items()}
+        return {name: np.memmap(self._path(name), dtype=dtype, mode='r', shape=(rows,) + shape)
+                for name, (dtype, shape) in ARRAYS.items()}
+
+    def split_indices(self, test_size, seed=0):
+        # A row is in the test split when a multiplicative hash of its 'index' falls below
+        # test_size, so rows keep their split as the cache grows and a version is never
+        # evaluated on rows an earlier version trained on. Row numbers come back sorted
+        # so the memory maps are read front to back.
+        index = self.arrays()["index"].astype(np.uint64)
+        hashed = ((index + np.uint64(seed)) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+        test = hashed < np.uint64(test_size * 2 ** 32)
+        return np.flatnonzero(~test), np.flatnonzero(test)
+
+    def rows_after(self, index_value):
+        # First row number whose 'index' is above index_value; rows are in index order
+        return int(np.searchsorted(self.arrays()["index"], index_value, side="right"))
+
+    def train_test_split(self, test_size, seed=0):
+        # ((horizontal, vertical, meta_input), labels) for the train and test rows
+        arrays = self.arrays()
+        splits = []
+        for rows in self.split_indices(test_size, seed):
+            splits.append(((arrays["horizontal"][rows], arrays["vertical"][rows], arrays["meta_input"][rows]),
+                           arrays["labels"][rows]))
+        return splits[0], splits[1]
@@ -0,0 +1,59 @@
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+# tf.data input for training straight from the TrainingCache memory maps. Blocks of
+# block_rows consecutive rows are read in shuffled order, their rows are shuffled
+# again through a shuffle_buffer row buffer and batched, so at most
+# read_parallelism blocks, the shuffle buffer and prefetch batches are resident.
+
+def cache_dataset(cache, rows, batch_size=512, shuffle_buffer=4096, block_rows=256, read_parallelism=4,
+                  num_classes=4, seed=0):
+    """Stream the given cache row numbers as ({horizontal, vertical, meta_input}, one-hot label) batches."""
+    arrays = cache.arrays()
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = np.arange(0, len(rows), block_rows, dtype=np.int64)
+
+    def read_block(start):
+        # Sorted row numbers, so each block is a near-sequential read of the maps
+        selected = rows[start:start + block_rows]
+        return (arrays["horizontal"][selected], arrays["vertical"][selected],
+                arrays["meta_input"][selected], arrays["labels"][selected])
+
+    def load(start):
+        horizontal, vertical, meta, labels = tf.numpy_function(
+            read_block, [start], [tf.float32, tf.float32, tf.float32, tf.int64]
+        )
+        horizontal.set_shape([None, arrays["horizontal"].shape[1]])
+        vertical.set_shape([None, arrays["vertical"].shape[1]])
+        meta.set_shape([None, arrays["meta_input"].shape[1]])
+        labels.set_shape([None])
+        return horizontal, vertical, meta, labels
+
+    def to_model_inputs(horizontal, vertical, meta, labels):
+        inputs = {"horizontal": horizontal, "vertical": vertical, "meta_input": meta}
+        return inputs, tf.one_hot(labels, num_classes)
+
+    dataset = tf.data.Dataset.from_tensor_slices(starts)
+    dataset = dataset.shuffle(max(len(starts), 1), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(load, num_parallel_calls=read_parallelism, deterministic=False)
+    dataset = dataset.unbatch().shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(to_model_inputs, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(2)
+
+class ThroughputCallback(keras.callbacks.Callback):
+    # Prints and keeps the training rows per second of every epoch
+
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+        self.rows_per_second = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._start
+        self.rows_per_second.append(self.rows / seconds)
+        print(f"Epoch {epoch + 1}: {self.rows} rows in {seconds:.2f}s, {self.rows_per_second[-1]:.0f} rows/s")
@@ -1,25 +1,46 @@
 import sys
 import os
+import copy
 import json
+import time
+import shutil
 import redis
 
 # Add the parent directory to the system path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import hopsworks
-from hsml.schema import Schema
-from hsml.model_schema import ModelSchema
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 from tensorflow import keras
 from bearing_model_training_pipeline.NNclassifier import create_model
 import joblib
-from bearing_condition_predictor.initialisation import FeatureGroupsLoader
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.initialisation import FeatureGroupsLoader, ModelLoader
+from bearing_condition_predictor.config_client import get_config_client
+from bearing_condition_predictor.numpy_engine import export_weights, weights_filename
+from bearing_model_training_pipeline.training_cache import TrainingCache
+from bearing_model_training_pipeline.training_input import ThroughputCallback, cache_dataset
+from bearing_model_training_pipeline.evaluation import check_promotion, report_metrics, score_models
+
+# A trained version is staged as a candidate under <model_subdirectory>/candidates/
+# <version>_<timestamp>: the model files to register in model/, and alongside them
+# what ModelPromoter needs to score, register and publish it. The evaluation report
+# stays in the candidate directory whether or not the version is promoted.
+CANDIDATES_DIRNAME = "candidates"
+CANDIDATE_FILENAME = "candidate.json"
+MODEL_SCHEMA_FILENAME = "model_schema.pkl"
+HELD_OUT_ROWS_FILENAME = "held_out_rows.npy"
+EVALUATION_FILENAME = "evaluation.json"
 
 class ModelTrainer:
-    def __init__(self, project, test_size, model_description, redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings'):
+    def __init__(self, project, test_size, model_description, redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings',
+                 submit_evaluation=None):
+        # submit_evaluation(candidate_dir) hands a staged version to ModelPromoter.evaluate,
+        # e.g. as a task on the evaluation queue, so training does not wait for the
+        # scoring; without it the candidate is evaluated in this process
         self.project = project
+        self.submit_evaluation = submit_evaluation
         self.feature_store = self.project.get_feature_store()
         self.test_size = test_size
         self.model_description = model_description
@@ -29,6 +50,13 @@ class ModelTrainer:
         self.redis_db = redis_db
         self.redis_key = redis_key
         self.redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db)
+        self.config_client = get_config_client(self.redis_host, self.redis_port, self.redis_db, self.redis_key)
+        self.cache = None
+        self.previous_model = None
+        self.previous_model_path = None
+        self.training_metrics = {}
+        self.training_mode = "full"
+        self.replay_seed = None
         self.load_config()
 
         # Initialize model details dynamically from config
@@ -45,14 +73,46 @@ class ModelTrainer:
         print(f"Feature View Version: {self.feature_view_version}")
 
         self.load_feature_view()
-        data, labels, X_train, y_train = self.prepare_data()
-        model, history = self.train_model(data, labels)
+        start = time.perf_counter()
+        if Config.TRAINING_CACHE:
+            self.previous_model = self.load_previous_model()
+        previous_accuracy = self.evaluate_accuracy(self.previous_model)
+        training_mode = self.select_training_mode()
+        if training_mode is None:
+            return
+
+        X_train = None
+        if training_mode == "incremental":
+            model, history, (data, labels) = self.fine_tune_model()
+        elif Config.TRAINING_INPUT == "stream":
+            dataset, train_rows, (data, labels) = self.prepare_dataset()
+            model, history = self.train_model(dataset, None, train_rows)
+        else:
+            data, labels, X_train, y_train = self.prepare_data()
+            model, history = self.train_model(data, labels)
+
+        # Recorded with the registry metrics so the modes can be compared over versions
+        self.training_metrics = {
+            "incremental": float(training_mode == "incremental"),
+            "training_seconds": time.perf_counter() - start,
+        }
+        if self.replay_seed is not None:
+            self.training_metrics["replay_seed"] = float(self.replay_seed)
+        accuracy = self.evaluate_accuracy(model)
+        if accuracy is not None:
+            self.training_metrics["test_accuracy"] = accuracy
+        if accuracy is not None and previous_accuracy is not None:
+            self.training_metrics["previous_test_accuracy"] = previous_accuracy
+            self.training_metrics["accuracy_delta"] = accuracy - previous_accuracy
+        print(f"Training mode: {training_mode}, metrics: {self.training_metrics}")
+        self.training_mode = training_mode
         self.save_model(model, history, X_train, labels, data[0], data[1], data[2])
 
     def load_config(self):
-        config_data_str = self.redis_client.get(self.redis_key)
-        if config_data_str:
-            self.config = json.loads(config_data_str)
+        config = self.config_client.get()
+        if config:
+            # A copy, so the shared config is never changed in place
+            self.config = copy.deepcopy(config)
             self.models = self.config.get('MODELS', {})
         else:
             self.config = {
@@ -76,6 +136,7 @@ class ModelTrainer:
                 self.model_subdirectory = latest_model['model_subdirectory']
                 self.model_filename = latest_model['filename']
                 self.model_version = latest_model['version']
+                self.latest_model = latest_model
                 self.model_versions = models  # Store all model versions for appending
         else:
             raise ValueError("No models found in config.")  # You may want to handle this case
@@ -87,6 +148,8 @@ class ModelTrainer:
                  .join(fg_frequency_2.select_all(), on="index")
                  .join(fg_frequency_3.select_all(), on="index")
                  .join(fg_time_domain.select_all(), on="index"))
+        self.query = query
+        self.index_feature = fg_time_domain.get_feature("index")
         self.feature_view = self.feature_store.get_or_create_feature_view(
             name=self.feature_view_name,
             version=self.feature_view_version,
@@ -95,6 +158,8 @@ class ModelTrainer:
         )
 
     def prepare_data(self):
+        if Config.TRAINING_CACHE:
+            return self.prepare_cached_data()
         X_train, X_test, y_train, y_test = self.feature_view.train_test_split(
             test_size=self.test_size,
             description='Bearing monitor',
@@ -108,15 +173,172 @@ class ModelTrainer:
         y_train_array = keras.utils.to_categorical(y_train.values, num_classes=4)
         return (horizontal_data, vertical_data, meta_data), y_train_array, X_train, y_train
 
-    def train_model(self, data, labels):
-        AEclassifier = create_model()
-        history = AEclassifier.fit(
-            data, labels, batch_size=512, epochs=15, shuffle=True
+    def update_cache(self):
+        # Only rows added since the last retrain are read from the feature store
+        cache = TrainingCache(Config.TRAINING_CACHE_DIR, self.feature_view_name, self.feature_view_version)
+        fetched = cache.update(
+            self.query, self.index_feature,
+            pending_index=self.feature_groups_loader.lowest_pending_index(),
+            read_options={"arrow_flight_config": {"timeout": 3600}}
+        )
+        print(f"Training cache: fetched {fetched} new rows, {cache.rows} cached")
+        return cache
+
+    def get_cache(self):
+        # Updated once per run and shared by mode selection, training and evaluation
+        if self.cache is None:
+            self.cache = self.update_cache()
+        return self.cache
+
+    def cached_rows(self, rows):
+        arrays = self.get_cache().arrays()
+        data = (arrays["horizontal"][rows], arrays["vertical"][rows], arrays["meta_input"][rows])
+        return data, keras.utils.to_categorical(arrays["labels"][rows], num_classes=4)
+
+    def prepare_cached_data(self):
+        # The split is drawn locally from the cached float32 matrices
+        cache = self.get_cache()
+        (data, y_train), _ = cache.train_test_split(self.test_size)
+        y_train_array = keras.utils.to_categorical(y_train, num_classes=4)
+        return data, y_train_array, None, y_train
+
+    def prepare_dataset(self):
+        # Streams the training rows from the cache files instead of loading them, and
+        # returns a few rows as the sample the model schema is built from
+        cache = self.get_cache()
+        train_rows, _ = cache.split_indices(self.test_size)
+        dataset = cache_dataset(
+            cache, train_rows, batch_size=Config.TRAINING_BATCH_SIZE,
+            shuffle_buffer=Config.TRAINING_SHUFFLE_BUFFER, block_rows=Config.TRAINING_BLOCK_ROWS
         )
+        return dataset, len(train_rows), self.cached_rows(train_rows[:8])
+
+    def load_previous_model(self):
+        # The currently served version, from the gateway's model directory if it is
+        # cached there, otherwise downloaded from the model registry
+        path = os.path.join(ModelLoader.LOCAL_MODEL_BASE_DIR, self.model_subdirectory,
+                            str(self.model_version), self.model_filename)
+        try:
+            if not os.path.exists(path):
+                retrieved_model = self.project.get_model_registry().get_model(
+                    name=self.model_subdirectory, version=self.model_version
+                )
+                if retrieved_model is None:
+                    return None
+                path = os.path.join(retrieved_model.download(), self.model_filename)
+            model = keras.models.load_model(path)
+            self.previous_model_path = path
+            return model
+        except Exception as e:
+            print(f"Could not load {self.model_subdirectory} version {self.model_version}: {e}")
+            return None
+
+    def evaluate_accuracy(self, model, rows=None):
+        # Accuracy on the cached test split, or on the given cache rows; None without the cache
+        if model is None or not Config.TRAINING_CACHE:
+            return None
+        if rows is None:
+            _, rows = self.get_cache().split_indices(self.test_size)
+        if len(rows) == 0:
+            return None
+        data, labels = self.cached_rows(rows)
+        predictions = model.predict(data, batch_size=Config.TRAINING_BATCH_SIZE, verbose=0)
+        return float(np.mean(np.argmax(predictions, axis=1) == np.argmax(labels, axis=1)))
+
+    def detect_drift(self, trained_through_index):
+        # Drift is a drop in the served model's accuracy on test rows added since it was
+        # trained, relative to the test rows that existed when it was trained
+        cache = self.get_cache()
+        _, test_rows = cache.split_indices(self.test_size)
+        first_new = cache.rows_after(trained_through_index)
+        old_rows, new_rows = test_rows[test_rows < first_new], test_rows[test_rows >= first_new]
+        if len(new_rows) < Config.DRIFT_MIN_ROWS or len(old_rows) == 0:
+            return False
+        drop = self.evaluate_accuracy(self.previous_model, old_rows) - self.evaluate_accuracy(self.previous_model, new_rows)
+        print(f"Served model accuracy drop on new rows: {drop:.3f}")
+        return drop > Config.DRIFT_ACCURACY_DROP
+
+    def split_new_rows(self):
+        # (new, old) training rows: those added since the served version was trained,
+        # and the earlier ones fine-tuning replays a sample of
+        cache = self.get_cache()
+        train_rows, test_rows = cache.split_indices(self.test_size)
+        first_new = cache.rows_after(self.latest_model["trained_through_index"])
+        return train_rows[train_rows >= first_new], train_rows[train_rows < first_new], test_rows
+
+    def select_training_mode(self):
+        # Fine-tune the served version unless a full retrain is due; None when there is
+        # too little new data to train a new version on
+        if Config.TRAINING_MODE != "incremental" or not Config.TRAINING_CACHE:
+            return "full"
+        trained_through_index = self.latest_model.get("trained_through_index")
+        if trained_through_index is None or self.previous_model is None:
+            print("Full retrain: the served version has no recorded training rows or could not be loaded")
+            return "full"
+        if self.latest_model.get("incremental_since_full", 0) + 1 >= Config.FULL_RETRAIN_EVERY:
+            print(f"Full retrain: {Config.FULL_RETRAIN_EVERY} versions since the last one")
+            return "full"
+        if self.detect_drift(trained_through_index):
+            print("Full retrain: drift detected")
+            return "full"
+        new_rows, _, _ = self.split_new_rows()
+        if len(new_rows) < Config.FINE_TUNE_MIN_NEW_ROWS:
+            print(f"No new version: {len(new_rows)} new training rows since version {self.model_version}, "
+                  f"fewer than {Config.FINE_TUNE_MIN_NEW_ROWS}")
+            return None
+        return "incremental"
+
+    def fine_tune_model(self):
+        # Rows added since the served version was trained, plus a bounded random replay
+        # of older rows so the model does not forget earlier degradation stages
+        new_rows, old_rows, test_rows = self.split_new_rows()
+        # Seeded so the replay sample of a version can be drawn again
+        seed = Config.REPLAY_SEED if Config.REPLAY_SEED is not None else self.model_version + 1
+        replay = np.random.default_rng(seed).choice(old_rows, size=min(Config.REPLAY_SAMPLE, len(old_rows)), replace=False)
+        rows = np.sort(np.concatenate((new_rows, replay)))
+        self.replay_seed = seed
+        print(f"Fine-tuning on {len(new_rows)} new rows and {len(replay)} replayed rows (seed {seed})")
+
+        data, labels = self.cached_rows(rows)
+        model = self.previous_model
+        # Recompiled with a lower learning rate so fine-tuning adjusts rather than overwrites
+        model.compile(
+            optimizer=keras.optimizers.Adam(learning_rate=Config.FINE_TUNE_LEARNING_RATE),
+            loss="categorical_crossentropy", metrics=["accuracy"]
+        )
+        validation_data = self.cached_rows(test_rows) if len(test_rows) else None
+        callbacks = [
+            ThroughputCallback(len(rows)),
+            keras.callbacks.EarlyStopping(
+                monitor="val_loss" if validation_data else "loss",
+                patience=Config.FINE_TUNE_PATIENCE, restore_best_weights=True
+            ),
+        ]
+        history = model.fit(
+            data, labels, batch_size=Config.TRAINING_BATCH_SIZE, epochs=Config.FINE_TUNE_EPOCHS,
+            shuffle=True, validation_data=validation_data, callbacks=callbacks
+        )
+        return model, history, (data, labels)
+
+    def train_model(self, data, labels, rows=None):
+        # labels is None when data is a tf.data.Dataset of (inputs, labels) batches
+        AEclassifier = create_model()
+        throughput = ThroughputCallback(rows if rows is not None else len(labels))
+        if labels is None:
+            history = AEclassifier.fit(data, epochs=15, callbacks=[throughput])
+        else:
+            history = AEclassifier.fit(
+                data, labels, batch_size=Config.TRAINING_BATCH_SIZE, epochs=15, shuffle=True, callbacks=[throughput]
+            )
         return AEclassifier, history
 
-    def save_model(self, model, history, X_train, y_train_array, horizontal_data, vertical_data, meta_data):
-        mr = self.project.get_model_registry()
+    def build_model_schema(self, y_train_array, horizontal_data, vertical_data, meta_data):
+        # The Hopsworks registry schema; None for the local registry, so the Hopsworks
+        # client is only needed, and imported, with FEATURE_STORE=hopsworks
+        if Config.FEATURE_STORE == "local":
+            return None
+        from hsml.schema import Schema
+        from hsml.model_schema import ModelSchema
 
         dtype = [('horizontal', np.float32, (horizontal_data.shape[1],)),
                  ('vertical', np.float32, (vertical_data.shape[1],)),
@@ -128,28 +350,175 @@ class ModelTrainer:
 
         input_schema = Schema(combined_array)
         output_schema = Schema(y_train_array)
-        model_schema = ModelSchema(
+        return ModelSchema(
             input_schema=input_schema, 
             output_schema=output_schema,
         )
 
-        model_dir = os.path.join(self.model_subdirectory)
-        if not os.path.isdir(model_dir):
-            os.makedirs(model_dir)
+    def save_model(self, model, history, X_train, y_train_array, horizontal_data, vertical_data, meta_data):
+        model_schema = self.build_model_schema(y_train_array, horizontal_data, vertical_data, meta_data)
+
+        version = self.model_version + 1
+        candidate_dir = os.path.join(self.model_subdirectory, CANDIDATES_DIRNAME, f"{version}_{int(time.time())}")
+        model_dir = os.path.join(candidate_dir, "model")
+        os.makedirs(model_dir)
 
         model.save(os.path.join(model_dir, self.model_filename))
+        # Registered with the model so gateways can serve it without TensorFlow
+        export_weights(model, os.path.join(model_dir, weights_filename(self.model_filename)))
+        joblib.dump(model_schema, os.path.join(candidate_dir, MODEL_SCHEMA_FILENAME))
 
         # Collect metrics from the training history
-        metrics = {key: value[-1] for key, value in history.history.items()}
+        metrics = {key: float(value[-1]) for key, value in history.history.items()}
+        metrics.update(self.training_metrics)
+
+        candidate = {
+            "model_name": self.model_name,
+            "model_subdirectory": self.model_subdirectory,
+            "filename": self.model_filename,
+            "description": self.model_description,
+            "version": version,
+            "champion_version": self.model_version,
+            "champion_path": self.previous_model_path,
+            "metrics": metrics,
+            "cache_args": None,
+        }
+        if self.cache is not None:
+            # Lets the next run fine-tune on just the rows added after this version
+            candidate["trained_through_index"] = self.cache.high_water_mark
+            candidate["incremental_since_full"] = (
+                self.latest_model.get('incremental_since_full', 0) + 1 if self.training_mode == "incremental" else 0
+            )
+        if Config.TRAINING_CACHE:
+            # The held-out rows as of now, so rows cached while the candidate waits for
+            # evaluation do not change what it is scored on
+            _, rows = self.get_cache().split_indices(self.test_size)
+            np.save(os.path.join(candidate_dir, HELD_OUT_ROWS_FILENAME), rows)
+            candidate["cache_args"] = [Config.TRAINING_CACHE_DIR, self.feature_view_name, self.feature_view_version]
+        with open(os.path.join(candidate_dir, CANDIDATE_FILENAME), 'w') as file:
+            json.dump(candidate, file, indent=2)
+
+        print(f"Version {version} staged in {candidate_dir}")
+        if self.submit_evaluation is not None:
+            self.submit_evaluation(candidate_dir)
+        else:
+            ModelPromoter(self.project, self.redis_host, self.redis_port, self.redis_db, self.redis_key).evaluate(candidate_dir)
+        return candidate_dir
+
+class ModelPromoter:
+    # Scores a staged candidate against the served version, and registers and publishes
+    # it if it passes the gate in check_promotion. Runs on the evaluation queue, one
+    # candidate at a time, so promotions of the same model do not race.
+
+    # Evaluation reports of versions that failed the promotion gate, newest first
+    REDIS_REJECTED_KEY = 'training:rejected_evaluations'
+    REJECTED_REPORTS_KEPT = 100
+
+    def __init__(self, project, redis_host='localhost', redis_port=6379, redis_db=0, redis_key='config:settings'):
+        self.project = project
+        self.redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
+        self.config_client = get_config_client(redis_host, redis_port, redis_db, redis_key)
 
-        # Increment model version before creating the new model entry
-        self.model_version += 1
+    def served_version(self, model_name):
+        # Highest version of model_name in the config, read again from Redis
+        config = self.config_client.refresh() or {}
+        model_versions = config.get('MODELS', {}).get(model_name)
+        if not model_versions:
+            return None
+        if isinstance(model_versions, dict):
+            model_versions = [model_versions]
+        return max(entry['version'] for entry in model_versions)
 
+    def evaluate(self, candidate_dir):
+        # Returns the evaluation report, None when the candidate was promoted without one
+        with open(os.path.join(candidate_dir, CANDIDATE_FILENAME), 'r') as file:
+            candidate = json.load(file)
+        model_dir = os.path.join(candidate_dir, "model")
+
+        report = self.evaluate_challenger(candidate, candidate_dir)
+        metrics = dict(candidate["metrics"])
+        if report is not None:
+            # Kept with the candidate, and registered with the model files if promoted
+            for directory in (candidate_dir, model_dir):
+                with open(os.path.join(directory, EVALUATION_FILENAME), 'w') as file:
+                    json.dump(report, file, indent=2)
+            metrics.update(report_metrics(report))
+            print(f"Evaluation of version {report['version']}: {report}")
+            if not report["promoted"]:
+                print(f"Version {report['version']} not promoted: {'; '.join(report['failures'])}")
+                self.redis_client.lpush(self.REDIS_REJECTED_KEY, json.dumps(report))
+                self.redis_client.ltrim(self.REDIS_REJECTED_KEY, 0, self.REJECTED_REPORTS_KEPT - 1)
+                # Only the report of a rejected version is kept
+                shutil.rmtree(model_dir)
+                return report
+
+        self.register(candidate, candidate_dir, model_dir, metrics)
+        return report
+
+    def evaluate_challenger(self, candidate, candidate_dir):
+        # Scores the candidate against the served version on the held-out cache rows and
+        # decides whether it is promoted; None when there is nothing to evaluate on
+        report = {
+            "version": candidate["version"],
+            "champion_version": None,
+            "challenger": None,
+            "champion": None,
+            "failures": [],
+            "evaluated_at": time.time(),
+        }
+        served_version = self.served_version(candidate["model_name"])
+        if served_version != candidate["champion_version"]:
+            # Another version was published while this one waited to be evaluated
+            report["failures"].append(
+                f"trained on version {candidate['champion_version']}, but version {served_version} is served"
+            )
+            report["promoted"] = False
+            return report
+
+        rows_path = os.path.join(candidate_dir, HELD_OUT_ROWS_FILENAME)
+        if candidate["cache_args"] is None:
+            print("No held-out rows without the training cache, promoting without evaluation")
+            return None
+        rows = np.load(rows_path)
+        if len(rows) == 0:
+            print("No held-out rows yet, promoting without evaluation")
+            return None
+
+        model_paths = {"challenger": os.path.join(candidate_dir, "model", candidate["filename"])}
+        if candidate["champion_path"] is not None:
+            model_paths["champion"] = candidate["champion_path"]
+        try:
+            scores = score_models(
+                model_paths, tuple(candidate["cache_args"]), rows,
+                max_workers=Config.EVALUATION_WORKERS, serving_mode=Config.MODEL_SERVING,
+                latency_rows=Config.EVALUATION_LATENCY_ROWS, batch_size=Config.TRAINING_BATCH_SIZE
+            )
+        except Exception as e:
+            report["failures"].append(f"evaluation failed: {e}")
+            report["promoted"] = False
+            return report
+        report["failures"] = check_promotion(
+            scores["challenger"], scores.get("champion"),
+            min_accuracy=Config.PROMOTION_MIN_ACCURACY,
+            max_accuracy_drop=Config.PROMOTION_MAX_ACCURACY_DROP,
+            max_class_accuracy_drop=Config.PROMOTION_MAX_CLASS_ACCURACY_DROP,
+            max_latency_ratio=Config.PROMOTION_MAX_LATENCY_RATIO
+        )
+        report.update(
+            champion_version=candidate["champion_version"] if "champion" in scores else None,
+            challenger=scores["challenger"],
+            champion=scores.get("champion"),
+            promoted=not report["failures"],
+        )
+        return report
+
+    def register(self, candidate, candidate_dir, model_dir, metrics):
+        mr = self.project.get_model_registry()
         model_entry = mr.tensorflow.create_model(
-            name=self.model_subdirectory,
-            description=self.model_description,
-            version=self.model_version,
-            model_schema=model_schema,
+            name=candidate["model_subdirectory"],
+            description=candidate["description"],
+            version=candidate["version"],
+            model_schema=joblib.load(os.path.join(candidate_dir, MODEL_SCHEMA_FILENAME)),
             metrics=metrics
         )
 
@@ -157,24 +526,29 @@ class ModelTrainer:
 
         # Append new model version to the existing model_versions array
         new_model_version = {
-            'model_subdirectory': self.model_subdirectory,
-            'filename': self.model_filename,
-            'version': self.model_version
+            'model_subdirectory': candidate["model_subdirectory"],
+            'filename': candidate["filename"],
+            'version': candidate["version"]
         }
-        if isinstance(self.model_versions, list):
-            self.model_versions.append(new_model_version)
-        elif isinstance(self.model_versions, dict):
-            self.model_versions = [self.model_versions, new_model_version]
-
-        # Update the config file with the new model version appended
-        self.save_config()
+        for key in ("trained_through_index", "incremental_since_full"):
+            if key in candidate:
+                new_model_version[key] = candidate[key]
 
-    def save_config(self):
-        # Update the MODELS key in the config dictionary
-        self.config['MODELS'][self.model_name] = self.model_versions
+        # A copy of the current config, since the shared one must not change before it
+        # is published
+        config = copy.deepcopy(self.config_client.refresh())
+        model_versions = config['MODELS'][candidate["model_name"]]
+        if isinstance(model_versions, list):
+            model_versions.append(new_model_version)
+        elif isinstance(model_versions, dict):
+            config['MODELS'][candidate["model_name"]] = [model_versions, new_model_version]
 
-        # Write back the updated config to Redis
-        self.redis_client.set(self.redis_key, json.dumps(self.config))
+        # Write back the updated config to Redis; gateways load the new version in the
+        # background and swap it in when ready, and the MQTT bridge routes to it
+        self.config_client.publish(config)
+        # Registered, so only the candidate record and report are kept
+        shutil.rmtree(model_dir)
+        print(f"Version {candidate['version']} registered and published")
       
 # Example usage
 #project = hopsworks.login()  # Assuming `project` is obtained from another script
@@ -7,12 +7,16 @@ import threading
 import paho.mqtt.client as mqtt
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+from snapshot_format import encode_snapshot
 
 # Define the base directory and server URL
 BASE_DIR = 'Learning_set'
 SERVER_URL = 'http://localhost:8080/sendData'
 BROKER = "127.0.0.1"
 NUM_WORKERS = 6  # Number of concurrent workers
+# "binary" (bearing id and time header plus float32 Hacc and Vacc) or "json" records,
+# for gateways that predate the binary format
+SNAPSHOT_FORMAT = 'binary'
 client = mqtt.Client("P1")
 client.connect(BROKER, 1883, 60)
 
@@ -26,12 +30,14 @@ def send_dataframe(csv_file, directory, client):
         m = df['m'].iloc[0]
         s = df['s'].iloc[0]
         time_str = f"{h:02}:{m:02}:{s:02}"
-        df['Directory'] = os.path.basename(directory)
-        print(time_str + ": "+ df['Directory'].iloc[0])
-        json_data = df.to_json(orient='records')
-        headers = {'Content-Type': 'application/json'}
-        client.publish("bearing/sendData", json_data, qos=0)
-        #response = requests.post(url, data=json_data, headers=headers)
+        bearing = os.path.basename(directory)
+        print(time_str + ": "+ bearing)
+        if SNAPSHOT_FORMAT == 'binary':
+            payload = encode_snapshot(bearing, h, m, s, df['ms'].iloc[0], df['Hacc'].to_numpy(), df['Vacc'].to_numpy())
+        else:
+            df['Directory'] = bearing
+            payload = df.to_json(orient='records')
+        client.publish("bearing/sendData", payload, qos=0)
         sleep(8)
         return (csv_file)
     except Exception as e:
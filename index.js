@@ -10,6 +10,43 @@ const port = 1883;
 let client = null
 let dataQueue = []; // Queue to store data for POST requests
 
+// Binary snapshots (bearing_condition_predictor/snapshot_format.py): a 20 byte header
+// with the bearing id and time, the bearing id padded to 4 bytes, then rows float32
+// Hacc and rows float32 Vacc, little endian. JSON payloads are the deviceSim records.
+const SNAPSHOT_MAGIC = Buffer.from('BSNP');
+const SNAPSHOT_VERSION = 1;
+const SNAPSHOT_HEADER_BYTES = 20;
+const DISPLAY_ROWS = 20; // Rows of each snapshot forwarded to the front end
+
+function isBinarySnapshot(payload) {
+    return payload.length >= SNAPSHOT_HEADER_BYTES && payload.subarray(0, 4).equals(SNAPSHOT_MAGIC);
+}
+
+function decodeSnapshot(payload) {
+    // Only the displayed rows are decoded, as records in the JSON layout
+    const version = payload.readUInt8(4);
+    if (version !== SNAPSHOT_VERSION) {
+        throw new Error(`Unsupported binary snapshot version ${version}`);
+    }
+    const h = payload.readUInt8(5);
+    const m = payload.readUInt8(6);
+    const s = payload.readUInt8(7);
+    const idLength = payload.readUInt8(8);
+    const rows = payload.readUInt32LE(12);
+    const ms = payload.readFloatLE(16);
+    const Directory = payload.toString('utf8', SNAPSHOT_HEADER_BYTES, SNAPSHOT_HEADER_BYTES + idLength);
+    const offset = SNAPSHOT_HEADER_BYTES + Math.ceil(idLength / 4) * 4;
+    const records = [];
+    for (let i = 0; i < Math.min(rows, DISPLAY_ROWS); i++) {
+        records.push({
+            h, m, s, ms, Directory,
+            Hacc: payload.readFloatLE(offset + 4 * i),
+            Vacc: payload.readFloatLE(offset + 4 * (rows + i)),
+        });
+    }
+    return records;
+}
+
 mqttServer.listen(port, function () {
   console.log('Aedes MQTT server started and listening on port ', port)
 })
@@ -20,10 +57,11 @@ aedes.on('client', function(client) {
 
 aedes.on('publish', function(packet, client) {
     if (packet.topic === 'bearing/sendData') {
-        let body = packet.payload.toString();
         console.log(`Received publish on topic ${packet.topic}`);
         try {
-            const parsedData = JSON.parse(body);
+            const parsedData = isBinarySnapshot(packet.payload)
+                ? decodeSnapshot(packet.payload)
+                : JSON.parse(packet.payload.toString());
             const firstRow = parsedData[0];
             const { h, m, s, Directory } = firstRow;
             const formattedTime = `${String(h).padStart(2, '0')}:${String(m).padStart(2, '0')}:${String(s).padStart(2, '0')}`;
@@ -75,7 +113,7 @@ async function processQueue() {
             // Check if data is an array and truncate if necessary
             if (Array.isArray(data) && data.length > 0 && data[0].h !== undefined) {
                 // Process array of rows with timestamps
-                const slicedData = data.slice(0, 20); // Take only the first 20 rows
+                const slicedData = data.slice(0, DISPLAY_ROWS); // Take only the first 20 rows
 
                 for (const rowData of slicedData) {
                     const hours = String(rowData.h).padStart(2, '0');
@@ -3,104 +3,128 @@
 
 import paho.mqtt.client as mqtt
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import redis
-from time import sleep
+import threading
+import time
+from bearing_condition_predictor.config_client import get_config_client
+from bearing_condition_predictor.snapshot_dispatch import OrderedDispatcher, report_metrics
+from snapshot_format import (SNAPSHOT_CONTENT_TYPE, JSON_CONTENT_TYPE, decode_snapshot, is_binary, read_header,
+                             snapshot_to_json)
 
 # MQTT configuration
 MQTT_BROKER = 'localhost'  # Replace with your MQTT broker
 LISTEN_TOPIC = 'bearing/sendData'
 PUBLISH_TOPIC = 'bearing/label'
 
+# HTTP bridge configuration
+MAX_IN_FLIGHT = 8  # Prediction requests sent to the ML server at the same time
+MAX_QUEUED_PER_BEARING = 100  # Oldest snapshots of a bearing are dropped beyond this
+REQUEST_TIMEOUT = 30  # Seconds before a prediction request is abandoned
+METRICS_INTERVAL = 10  # Seconds between metrics snapshots
+
 # Initialize Redis client
 redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
 
 # Redis key for the model settings
 REDIS_SETTINGS_KEY = 'config:settings'
+# Redis key the bridge metrics are written to every METRICS_INTERVAL seconds
+REDIS_METRICS_KEY = 'mqtt_bridge:metrics'
+
+# Keep-alive connections to the ML server, one per request that can be in flight
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_IN_FLIGHT))
 
-def get_flask_server_url():
-    # Fetch the configuration from Redis
-    config_data = redis_client.get(REDIS_SETTINGS_KEY)
-    
-    if not config_data:
-        raise ValueError("No configuration found in Redis")
-
-    # Parse the JSON configuration
-    config = json.loads(config_data)
-    
-    # Initialize variables to store the latest model and version
-    latest_model_name = None
-    latest_version = -1
-
-    # Iterate through the models to find the one with the highest version
-    for model_name, model_entries in config['MODELS'].items():
-        for entry in model_entries:
-            version = entry.get('version', -1)
-            if version > latest_version:
-                latest_version = version
-                latest_model_name = entry['model_subdirectory']
-
-    if latest_model_name is None:
+def get_flask_server_url(config_client):
+    # The newest model version, kept in memory by the config client and updated when a
+    # new version is published, so no Redis read per message
+    latest = config_client.latest_model()
+    if latest is None:
         raise ValueError("No valid model settings found in Redis")
+    latest_model_name, latest_version = latest
 
     url = f'http://localhost:5000/api/{latest_model_name}/{latest_version}/predict'
     return url, latest_model_name, latest_version
 
+class SnapshotBridge:
+    # Sends snapshots to the ML server through an OrderedDispatcher: at most
+    # MAX_IN_FLIGHT requests at a time, one per bearing, in arrival order per bearing
+
+    def __init__(self, client):
+        self.client = client
+        self.dispatcher = OrderedDispatcher(self._send, MAX_IN_FLIGHT, MAX_QUEUED_PER_BEARING,
+                                            thread_name_prefix="bridge")
+        # Cleared when the ML server turns down a binary snapshot; JSON from then on
+        self.binary_accepted = True
+        # Created here rather than at import, which would need Redis to be up
+        self._config_client = get_config_client(redis_key=REDIS_SETTINGS_KEY)
+
+    def _post(self, url, payload):
+        binary = is_binary(payload)
+        if binary and not self.binary_accepted:
+            payload, binary = snapshot_to_json(decode_snapshot(payload)), False
+        content_type = SNAPSHOT_CONTENT_TYPE if binary else JSON_CONTENT_TYPE
+        response = session.post(url, data=payload, headers={'Content-Type': content_type}, timeout=REQUEST_TIMEOUT)
+        if binary and response.status_code == 415:
+            print("ML server does not accept binary snapshots, falling back to JSON")
+            self.binary_accepted = False
+            return self._post(url, payload)
+        return response
+
+    def _send(self, payload):
+        # Fetch the latest Flask server URL
+        flask_server_url, model_name, version = get_flask_server_url(self._config_client)
+
+        # The payload is forwarded as it arrived, binary or JSON
+        sent_at = time.monotonic()
+        response = self._post(flask_server_url, payload)
+        response_data = response.json()
+        self.dispatcher.record("round_trip", time.monotonic() - sent_at)
+        self.client.publish(PUBLISH_TOPIC, json.dumps(response_data))
+        print(f"Published response of model {model_name} version {version} to topic {PUBLISH_TOPIC}: {response_data}")
+        return response.ok
+
 # Callback when the client receives a CONNACK response from the server
 def on_connect(client, userdata, flags, rc):
     print(f"Connected with result code {rc}")
     client.subscribe(LISTEN_TOPIC)
     if rc != 0:
         print(f"Failed to connect, return code {rc}")
-        
+
 def on_disconnect(client, userdata, rc):
+    # loop_forever reconnects by itself
     print(f"Disconnected with result code {rc}")
-    if rc != 0:
-        print("Unexpected disconnection. Reconnecting...")
-        client.reconnect()
 
 # Callback when a PUBLISH message is received from the server
 def on_message(client, userdata, msg):
     print(f"Message received on topic {msg.topic}")
-    data = json.loads(msg.payload.decode())
-    first_row = data[0]
-    directory = first_row.get("Directory")
-    h = first_row.get("h")
-    m = first_row.get("m")
-    s = first_row.get("s")
-    time_str = f"{h:02}:{m:02}:{s:02}"
-    print(time_str + ": " + directory)
-    
     try:
-        # Fetch the latest Flask server URL
-        flask_server_url, model_name, version = get_flask_server_url()
-        
-        # Print the model name and version
-        print(f"Using model: {model_name}, version: {version}")
-        
-        # The payload is already a JSON string, so we can send it directly
-        payload = msg.payload.decode()
-        response = requests.post(flask_server_url, data=payload, headers={'Content-Type': 'application/json'})
-        response_data = response.json()
-        client.publish(PUBLISH_TOPIC, json.dumps(response_data))
-        print(f"Published response to topic {PUBLISH_TOPIC}: {response_data}")
+        first_row = read_header(msg.payload)
+        directory = first_row.get("Directory")
+        h = first_row.get("h")
+        m = first_row.get("m")
+        s = first_row.get("s")
+        time_str = f"{h:02}:{m:02}:{s:02}"
+        print(time_str + ": " + directory)
+        userdata.submit(directory, msg.payload)
     except Exception as e:
         print(f"Error processing message: {e}")
+        userdata.count_error()
+
+if __name__ == "__main__":
+    # Create an MQTT client instance
+    client = mqtt.Client()
+    dispatcher = SnapshotBridge(client).dispatcher
+    client.user_data_set(dispatcher)
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    threading.Thread(target=report_metrics, args=(dispatcher, redis_client, REDIS_METRICS_KEY, METRICS_INTERVAL),
+                     daemon=True).start()
 
-# Create an MQTT client instance
-client = mqtt.Client()
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.on_message = on_message
-
-# Connect to the MQTT broker
-try:
-    client.connect(MQTT_BROKER, 1883, 60)
-except Exception as e:
-    print(f"Failed to connect to MQTT broker: {e}")
-
-# Start the MQTT client loop
-while True:
-    client.loop_start()
-    sleep(2)
-    client.loop_stop()
+    # Connect to the MQTT broker and run the network loop on this thread, retrying the
+    # connection until the broker is up
+    client.connect_async(MQTT_BROKER, 1883, 60)
+    client.loop_forever(retry_first_connection=True)
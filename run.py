@@ -1,4 +1,6 @@
-from bearing_condition_predictor import app
+from bearing_condition_predictor import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,128 @@
+import re
+import json
+import struct
+from collections import namedtuple
+import numpy as np
+
+# Wire formats of a snapshot on bearing/sendData and the predict endpoint.
+#
+# Binary, content type application/x-bearing-snapshot, little endian:
+#   header   20 bytes   magic b'BSNP', version, h, m, s, bearing id length, 3 pad bytes,
+#                       rows (uint32), ms of the first row (float32)
+#   bearing  id length bytes of UTF-8, zero padded to a multiple of 4
+#   Hacc     rows float32
+#   Vacc     rows float32
+#
+# JSON, application/json: the deviceSim.py records, [{"h", "m", "s", "ms", "Hacc",
+# "Vacc", "Directory"}, ...]. MQTT 3.1.1 messages carry no content type, so a payload
+# starting with the magic bytes is binary and anything else is read as JSON.
+#
+# Kept outside bearing_condition_predictor so deviceSim.py can import it without
+# initialising the server package.
+
+SNAPSHOT_CONTENT_TYPE = 'application/x-bearing-snapshot'
+JSON_CONTENT_TYPE = 'application/json'
+MAGIC = b'BSNP'
+VERSION = 1
+# Rows per snapshot the features and models are built for
+SNAPSHOT_ROWS = 2560
+HEADER = struct.Struct('<4sBBBBB3xIf')
+
+class Snapshot(namedtuple("Snapshot", ["directory", "h", "m", "s", "ms", "hacc", "vacc"])):
+    @property
+    def monitoring_time(self):
+        return f"{self.h:02}:{self.m:02}:{self.s:02}"
+
+def is_binary(payload):
+    return payload[:len(MAGIC)] == MAGIC
+
+def encode_snapshot(directory, h, m, s, ms, hacc, vacc):
+    bearing = directory.encode()
+    hacc = np.ascontiguousarray(hacc, dtype='<f4')
+    vacc = np.ascontiguousarray(vacc, dtype='<f4')
+    if len(hacc) != len(vacc):
+        raise ValueError("Hacc and Vacc must have the same number of rows")
+    padding = b'\0' * (-len(bearing) % 4)
+    header = HEADER.pack(MAGIC, VERSION, int(h), int(m), int(s), len(bearing), len(hacc), float(ms))
+    return header + bearing + padding + hacc.tobytes() + vacc.tobytes()
+
+def decode_header(payload):
+    # (Snapshot fields without the arrays, offset of Hacc) of a binary snapshot
+    if len(payload) < HEADER.size:
+        raise ValueError("Binary snapshot is shorter than its header")
+    magic, version, h, m, s, id_length, rows, ms = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("Not a binary snapshot")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary snapshot version {version}")
+    directory = bytes(payload[HEADER.size:HEADER.size + id_length]).decode()
+    offset = HEADER.size + id_length + (-id_length % 4)
+    if len(payload) != offset + 8 * rows:
+        raise ValueError(f"Binary snapshot of {rows} rows has {len(payload)} bytes")
+    return (directory, h, m, s, ms, rows), offset
+
+def decode_snapshot(payload):
+    # Hacc and Vacc are read-only float32 views of payload, nothing is copied
+    (directory, h, m, s, ms, rows), offset = decode_header(payload)
+    hacc = np.frombuffer(payload, dtype='<f4', count=rows, offset=offset)
+    vacc = np.frombuffer(payload, dtype='<f4', count=rows, offset=offset + 4 * rows)
+    return Snapshot(directory, h, m, s, ms, hacc, vacc)
+
+def snapshot_from_records(data):
+    # The JSON fallback, from decoded deviceSim.py records
+    if not isinstance(data, list) or not data:
+        raise ValueError("No JSON data found")
+    if not all(isinstance(item, dict) for item in data):
+        raise ValueError("List items must be dictionaries")
+    first_row = data[0]
+    try:
+        hacc = np.array([item["Hacc"] for item in data], dtype=float)
+        vacc = np.array([item["Vacc"] for item in data], dtype=float)
+        return Snapshot(first_row.get("Directory"), first_row["h"], first_row["m"], first_row["s"],
+                        first_row.get("ms", 0.0), hacc, vacc)
+    except KeyError as e:
+        raise ValueError(f"Records are missing {e}")
+
+def snapshot_to_json(snapshot):
+    # JSON records of a decoded snapshot, for receivers without the binary format; every
+    # row carries the first row's ms, the only one the binary format keeps
+    return json.dumps([{"h": snapshot.h, "m": snapshot.m, "s": snapshot.s, "ms": snapshot.ms,
+                        "Hacc": float(hacc), "Vacc": float(vacc), "Directory": snapshot.directory}
+                       for hacc, vacc in zip(snapshot.hacc, snapshot.vacc)])
+
+def check_rows(snapshot):
+    # Snapshots of any other length would give features on a different scale, and their
+    # inputs could not be stacked into a batch with the others
+    for name, samples in (("Hacc", snapshot.hacc), ("Vacc", snapshot.vacc)):
+        if len(samples) != SNAPSHOT_ROWS:
+            raise ValueError(f"Snapshot has {len(samples)} {name} rows, expected {SNAPSHOT_ROWS}")
+    return snapshot
+
+def read_snapshot(payload):
+    # A snapshot in either format, as published on bearing/sendData
+    if is_binary(payload):
+        return decode_snapshot(payload)
+    return snapshot_from_records(json.loads(payload))
+
+ARRAY_START = re.compile(r'\s*\[\s*')
+json_decoder = json.JSONDecoder()
+
+def read_first_row(payload):
+    # The snapshot is a JSON array of records; only the first one is decoded here so the
+    # network thread does not decode all 2560 rows
+    text = payload.decode('utf-8-sig')
+    start = ARRAY_START.match(text)
+    if start is None:
+        raise ValueError("Snapshot is not a JSON array")
+    first_row, _ = json_decoder.raw_decode(text, start.end())
+    if not isinstance(first_row, dict):
+        raise ValueError("Snapshot records must be objects")
+    return first_row
+
+def read_header(payload):
+    # Bearing and time fields of a snapshot in either format, as a JSON record would
+    # have them, without decoding the samples
+    if is_binary(payload):
+        (directory, h, m, s, ms, rows), _ = decode_header(payload)
+        return {"Directory": directory, "h": h, "m": m, "s": s, "ms": ms}
+    return read_first_row(payload)
@@ -45,6 +45,8 @@ echo "Starting Celery worker..."
 celery -A bearing_condition_predictor.celery beat --loglevel=info &
 celery -A bearing_condition_predictor.celery worker -Q feat_pipe_queue --loglevel=info --pool threads &
 celery -A bearing_condition_predictor.celery worker -Q training_pipe_queue --loglevel=info --pool threads &
+# One candidate at a time, so promotions of the same model do not race
+celery -A bearing_condition_predictor.celery worker -Q evaluation_queue --loglevel=info --pool threads --concurrency 1 &
 CELERY_PID=$!
 
 # Start the Flask application with Gunicorn
@@ -0,0 +1,29 @@
+import os
+import numpy as np
+
+from bearing_feat_eng_pipeline.AutoEncoder import AutoEncoder, StreamingStageClusterer
+
+def chunk(seed, rows=50):
+    return np.random.default_rng(seed).gamma(2.0, 1.0, size=(rows, 1282)).astype(np.float32)
+
+def test_clusterer_state_is_kept_only_on_commit(tmp_path):
+    state_path = str(tmp_path / "clusters.pkl")
+    autoencoder = AutoEncoder(warm_start=False, max_epochs=1, cluster_state_path=state_path)
+    features = chunk(0)
+
+    # A chunk labelled again after a failed upload does not count twice
+    first = autoencoder.get_anomaly_labels(features[:40], features)
+    retried = autoencoder.get_anomaly_labels(features[:40], features)
+    assert autoencoder.clusterer.rows_seen == 0
+    assert autoencoder.clusterer.scores.count == 0
+    assert not os.path.exists(state_path)
+    assert len(first) == len(retried) == len(features)
+
+    autoencoder.commit_labels()
+    assert autoencoder.clusterer.rows_seen == len(features)
+    assert autoencoder.clusterer.scores.count == len(features)
+    assert StreamingStageClusterer(state_path).rows_seen == len(features)
+
+    # Nothing pending, so a second commit changes nothing
+    autoencoder.commit_labels()
+    assert autoencoder.clusterer.rows_seen == len(features)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from bearing_condition_predictor.batching import InferenceBatcher
+from bearing_condition_predictor.model_cache import ModelCache
+
+class EchoModel:
+    # Sized like a NumpyModel so the cache can account for it
+    def __init__(self, nbytes):
+        self.arrays = {"weights": np.zeros(nbytes, dtype=np.uint8)}
+
+    def predict(self, inputs, verbose=0):
+        return inputs[0] * 2
+
+def predict(version, model):
+    return InferenceBatcher.predict("model", version, model, [np.full((1, 3), version, dtype=np.float32)])
+
+def test_evicted_versions_lose_their_queue():
+    cache = ModelCache(250, on_evict=lambda key: InferenceBatcher.remove(*key))
+    queues = {}
+
+    for version in range(1, 6):
+        model = EchoModel(100)
+        cache.put(("model", version), model)
+        assert predict(version, model).tolist() == [[version * 2] * 3]
+        queues[version] = InferenceBatcher._queues[("model", version)]
+
+    # Only the two versions that still fit the budget keep a queue and a worker thread
+    assert {key for key in InferenceBatcher._queues if key[0] == "model"} == {("model", 4), ("model", 5)}
+    for version in range(1, 4):
+        queues[version]._worker.join(timeout=5)
+        assert not queues[version]._worker.is_alive()
+
+    cache.discard(("model", 4))
+    assert ("model", 4) not in InferenceBatcher._queues
+    InferenceBatcher.remove("model", 5)
+
+def test_request_after_removal_gets_a_new_queue():
+    model = EchoModel(10)
+    predict(7, model)
+    InferenceBatcher.remove("model", 7)
+    assert ("model", 7) not in InferenceBatcher._queues
+
+    # A request that resolved the version before it was dropped is still answered
+    assert predict(7, model).tolist() == [[14] * 3]
+    InferenceBatcher.remove("model", 7)
@@ -0,0 +1,150 @@
+import types
+import numpy as np
+import pandas as pd
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from bearing_condition_predictor.config import Config
+from bearing_condition_predictor.feature_log import FeatureLog
+from bearing_condition_predictor.initialisation import FeatureGroupsLoader
+from bearing_condition_predictor.local_feature_store import LocalFeatureGroup
+from bearing_condition_predictor.single_feat_eng import N_FREQUENCY_BINS, TIME_COLUMNS
+from bearing_feat_eng_pipeline import feat_eng_pipe
+from bearing_feat_eng_pipeline.feat_eng_pipe import FeatureEngineeringPipeline, insert_all, insert_with_retry
+
+CHUNK_ROWS = 50
+
+class RejectingFeatureGroup(LocalFeatureGroup):
+    # Fails every insert the way a schema mismatch would
+    def insert(self, df, wait=True, overwrite=False):
+        self.insert_calls += 1
+        raise ValueError(f"Schema mismatch for {self.name}")
+
+class StubAutoEncoder:
+    def __init__(self):
+        self.commits = 0
+
+    def get_anomaly_labels(self, Xt, Xf):
+        return np.arange(len(Xf)) % 4
+
+    def commit_labels(self):
+        self.commits += 1
+
+def make_groups(**time_domain_options):
+    names = [f"frequency_domain_features_{i}" for i in range(4)]
+    return [LocalFeatureGroup(name) for name in names] + [LocalFeatureGroup("time_domain_features", **time_domain_options)]
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis()
+
+@pytest.fixture
+def make_pipeline(tmp_path, monkeypatch, redis_client):
+    # A pipeline over an in-memory local feature store, a fake Redis and a feature log
+    # holding one chunk of records
+    monkeypatch.setattr(Config, "FEATURE_LOG_FORMAT", "binary")
+    monkeypatch.setattr(Config, "UPLOAD_RETRIES", 2)
+    monkeypatch.setattr(Config, "UPLOAD_BACKOFF", 0.0)
+    feature_log = FeatureLog(str(tmp_path / "feature_log"))
+    for i in range(CHUNK_ROWS):
+        feature_log.append(f"Bearing{i}", "00:00:00", np.full(N_FREQUENCY_BINS, i, dtype=np.float32),
+                           np.full(N_FREQUENCY_BINS, i, dtype=np.float32),
+                           np.full(len(TIME_COLUMNS), i, dtype=np.float32))
+    monkeypatch.setattr(feat_eng_pipe, "get_feature_log", lambda: feature_log)
+    monkeypatch.setattr(feat_eng_pipe, "redis", types.SimpleNamespace(StrictRedis=lambda **kwargs: redis_client))
+    autoencoder = StubAutoEncoder()
+    monkeypatch.setattr(feat_eng_pipe, "get_autoencoder", lambda: autoencoder)
+
+    def make(groups):
+        loader = object.__new__(FeatureGroupsLoader)
+        loader.redis_client = redis_client
+        (loader.fg_frequency_0, loader.fg_frequency_1, loader.fg_frequency_2, loader.fg_frequency_3,
+         loader.fg_time_domain) = groups
+        monkeypatch.setattr(feat_eng_pipe, "get_feature_groups_loader", lambda: loader)
+        return FeatureEngineeringPipeline(None, None)
+    return make
+
+def joined_indices(groups):
+    query = groups[0].select_all()
+    for group in groups[1:]:
+        query = query.join(group.select_all(), on="index")
+    return query.read()["index"].tolist()
+
+def test_insert_with_retry_retries_transient_errors():
+    feature_group = LocalFeatureGroup("time_domain_features", failures=2)
+    df = pd.DataFrame({"index": range(5), "value": 1.0})
+
+    insert_with_retry(feature_group, df, retries=3, backoff=0.0)
+
+    assert feature_group.insert_calls == 3
+    assert feature_group.read()["index"].tolist() == list(range(5))
+
+def test_insert_with_retry_gives_up_after_retries():
+    feature_group = LocalFeatureGroup("time_domain_features", failures=5)
+
+    with pytest.raises(ConnectionError):
+        insert_with_retry(feature_group, pd.DataFrame({"index": [0]}), retries=2, backoff=0.0)
+    assert feature_group.insert_calls == 3
+
+def test_insert_with_retry_raises_other_errors_at_once():
+    feature_group = RejectingFeatureGroup("time_domain_features")
+
+    with pytest.raises(ValueError):
+        insert_with_retry(feature_group, pd.DataFrame({"index": [0]}), retries=3, backoff=0.0)
+    assert feature_group.insert_calls == 1
+
+def test_insert_all_finishes_every_insert_before_raising():
+    groups = [LocalFeatureGroup(f"group_{i}", insert_latency=0.05) for i in range(4)]
+    groups.append(LocalFeatureGroup("failing", failures=10))
+    dfs = [pd.DataFrame({"index": range(3)}) for _ in groups]
+
+    with pytest.raises(ConnectionError):
+        insert_all(groups, dfs, max_workers=5, retries=1, backoff=0.0)
+    assert all(len(group.read()) == 3 for group in groups[:4])
+    assert groups[-1].insert_calls == 2
+
+def test_failed_upload_is_not_committed_and_retry_succeeds(make_pipeline, redis_client):
+    # More failures than retries, so the first run's upload fails
+    groups = make_groups(failures=Config.UPLOAD_RETRIES + 1)
+    pipeline = make_pipeline(groups)
+
+    with pytest.raises(ConnectionError):
+        pipeline.run()
+    assert redis_client.get(pipeline.REDIS_LAST_READ_KEY) is None
+    assert len(groups[-1].read()) == 0
+    assert pipeline.feature_extractor.commits == 0
+
+    # The failed range is released, so the training cache is not held back by it
+    assert pipeline.feature_groups_loader.lowest_pending_index() is None
+
+    pipeline = make_pipeline(groups)
+    pipeline.run()
+    assert int(redis_client.get(pipeline.REDIS_LAST_READ_KEY)) == CHUNK_ROWS
+    assert pipeline.feature_extractor.commits == 1
+    # Uploaded under a new range; the partial rows of the failed attempt do not join
+    assert joined_indices(groups) == list(range(CHUNK_ROWS, 2 * CHUNK_ROWS))
+    assert redis_client.hlen(FeatureGroupsLoader.REDIS_RESERVATIONS_KEY) == 0
+
+def test_rejected_upload_is_not_retried(make_pipeline, redis_client):
+    groups = make_groups()
+    groups[-1] = RejectingFeatureGroup("time_domain_features")
+    pipeline = make_pipeline(groups)
+
+    with pytest.raises(ValueError):
+        pipeline.run()
+    assert groups[-1].insert_calls == 1
+    assert redis_client.get(pipeline.REDIS_LAST_READ_KEY) is None
+    assert pipeline.feature_groups_loader.lowest_pending_index() is None
+
+def test_interrupted_upload_keeps_its_range(make_pipeline, redis_client):
+    # A worker that died mid-upload never released its range: the next run reuses it
+    # so the rows already inserted are overwritten, and only then releases it
+    groups = make_groups()
+    pipeline = make_pipeline(groups)
+    pipeline.feature_groups_loader.reserve_index_range(CHUNK_ROWS, f"{pipeline.REDIS_LAST_READ_KEY}:0")
+    assert pipeline.feature_groups_loader.lowest_pending_index() == 0
+
+    pipeline.run()
+    assert joined_indices(groups) == list(range(CHUNK_ROWS))
+    assert pipeline.feature_groups_loader.lowest_pending_index() is None
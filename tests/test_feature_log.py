@@ -0,0 +1,56 @@
+import numpy as np
+
+from bearing_condition_predictor.feature_log import FeatureLog, RECORD_DTYPE
+from bearing_condition_predictor.single_feat_eng import N_FREQUENCY_BINS, TIME_COLUMNS
+
+def append_records(feature_log, count, start=0):
+    for i in range(start, start + count):
+        h_freq = np.full(N_FREQUENCY_BINS, i, dtype=np.float32)
+        v_freq = np.full(N_FREQUENCY_BINS, -i, dtype=np.float32)
+        x_time = np.full(len(TIME_COLUMNS), i, dtype=np.float32)
+        feature_log.append(f"Bearing{i}", f"00:00:{i % 60:02}", h_freq, v_freq, x_time)
+
+def segment_files(directory):
+    return sorted(path.name for path in directory.glob("segment_*.bin"))
+
+def test_append_rotates_without_padding(tmp_path):
+    feature_log = FeatureLog(str(tmp_path), segment_records=10)
+    append_records(feature_log, 35)
+
+    assert feature_log.total_records() == 35
+    assert segment_files(tmp_path) == [f"segment_{i:06d}.bin" for i in range(1, 5)]
+    sizes = [(tmp_path / name).stat().st_size // RECORD_DTYPE.itemsize for name in segment_files(tmp_path)]
+    assert sizes == [10, 10, 10, 5]
+
+def test_read_across_segment_boundaries(tmp_path):
+    feature_log = FeatureLog(str(tmp_path), segment_records=10)
+    append_records(feature_log, 35)
+
+    records = feature_log.read(5, 25)
+    assert len(records) == 25
+    assert records["bearing"].tolist() == [f"Bearing{i}".encode() for i in range(5, 30)]
+    assert records["frequency"][:, 0].tolist() == list(range(5, 30))
+    assert not (records["bearing"] == b"").any()
+
+    assert len(feature_log.read(30, 100)) == 5
+    assert len(feature_log.read(35, 10)) == 0
+
+def test_compact_keeps_global_record_numbers(tmp_path):
+    feature_log = FeatureLog(str(tmp_path), segment_records=10)
+    append_records(feature_log, 35)
+
+    feature_log.compact(25)
+    # Only segments entirely before record 25 go; the one holding 20-29 stays
+    assert segment_files(tmp_path) == ["segment_000003.bin", "segment_000004.bin"]
+    assert feature_log.total_records() == 35
+    assert feature_log.read(20, 15)["bearing"].tolist() == [f"Bearing{i}".encode() for i in range(20, 35)]
+    assert len(feature_log.read(0, 20)) == 0
+
+    append_records(feature_log, 10, start=35)
+    assert feature_log.total_records() == 45
+    assert feature_log.read(40, 5)["bearing"].tolist() == [f"Bearing{i}".encode() for i in range(40, 45)]
+
+    feature_log.compact(45)
+    # The active segment is never removed
+    assert segment_files(tmp_path) == ["segment_000005.bin"]
+    assert feature_log.total_records() == 45